@@ -16,20 +16,29 @@ import webbrowser
 
 from PyQt5.QtCore import QCoreApplication
 
+from qgis.core import QgsApplication
+
 from .tools.cutter import Cutter
 from .tools.oneSideBuffer import OneSideBuffer
 from .tools.painter import Painter
 from .dialogs.about import aboutPanel
 from .tools.attributesJoinByLine import AttributesJoinByLine
+from .algorithms.provider import GeofabrykaProvider
 
 class GeofabrykaToolbox:
     def __init__(self, iface):
         self.iface = iface
+        self.actions = []
+        self.provider = None
+
+        # qgis_process loads the plugin without a GUI, only the Processing provider is needed
+        if self.iface is None:
+            return
+
         self.canvas = iface.mapCanvas()
         self.plugin_dir = os.path.dirname(__file__)
 
         self.mainToolbar = self.iface.addToolBar(u'Geofabryka Toolbox')
-        self.actions = []
         self.icon_path = ':/plugins/GeofabrykaToolbox/icons/'
         self.cutter = Cutter(self.iface,self.plugin_dir,self.mainToolbar,self.icon_path)
         self.buffer = OneSideBuffer(self.iface,self.plugin_dir,self.mainToolbar,self.icon_path)
@@ -47,6 +56,12 @@ class GeofabrykaToolbox:
 
     def initGui(self):
         self.first_start = True
+        self.initProcessing()
+
+    def initProcessing(self):
+        if self.provider is None:
+            self.provider = GeofabrykaProvider()
+            QgsApplication.processingRegistry().addProvider(self.provider)
 
     def openBrowser(self):
         webbrowser.open('http://geofabryka.pl/')
@@ -62,4 +77,11 @@ class GeofabrykaToolbox:
             self.iface.removePluginMenu(
                 self.tr(u'&Geofabryka Toolbox'),
                 action)
-            self.iface.removeToolBarIcon(action)
\ No newline at end of file
+            self.iface.removeToolBarIcon(action)
+
+        if self.iface is not None:
+            self.painter.unload()
+
+        if self.provider is not None:
+            QgsApplication.processingRegistry().removeProvider(self.provider)
+            self.provider = None
\ No newline at end of file
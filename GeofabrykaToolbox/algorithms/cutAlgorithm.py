@@ -0,0 +1,136 @@
+# -*- coding: utf-8 -*-
+
+# ***************************************************************************
+#   This program is free software; you can redistribute it and/or modify    *
+#   it under the terms of the GNU General Public License as published by    *
+#   the Free Software Foundation; either version 2 of the License, or       *
+#   (at your option) any later version.                                     *
+# ***************************************************************************
+#     begin                : 2019-09-17                                     *
+#     copyright            : (C) 2019 by Adrian Bocianowski                 *
+#     email                : adrian at bocianowski.com.pl                   *
+# ***************************************************************************
+
+from PyQt5.QtCore import QCoreApplication
+
+from qgis.core import (QgsProcessing, QgsProcessingAlgorithm, QgsProcessingException, QgsProcessingParameterFeatureSource,
+                       QgsProcessingParameterMultipleLayers, QgsProcessingParameterVectorLayer, QgsProcessingParameterNumber,
+                       QgsProcessingOutputNumber, QgsFeatureRequest, QgsProject)
+
+from ..tools.cutEngine import cutLayers, moveToTarget, applyCut
+from ..tools.layerIndex import indexCache
+
+class CutAlgorithm(QgsProcessingAlgorithm):
+    CUTTERS = 'CUTTERS'
+    SOURCES = 'SOURCES'
+    TARGET = 'TARGET'
+    CHUNK_SIZE = 'CHUNK_SIZE'
+    CUT_COUNT = 'CUT_COUNT'
+    MODIFIED_COUNT = 'MODIFIED_COUNT'
+
+    def createInstance(self):
+        return CutAlgorithm()
+
+    def displayName(self):
+        return self.tr('Cut elements')
+
+    def flags(self):
+        # Source and target layers are edited in place
+        return super().flags() | QgsProcessingAlgorithm.FlagNoThreading
+
+    def name(self):
+        return 'cutelements'
+
+    def shortHelpString(self):
+        return self.tr('Cuts the common part of every cutter polygon out of the source layers and saves it in the target layer, '
+                       'like the interactive "Cut elements" tool. Edits are committed every "Chunk size" cutter polygons.')
+
+    def tr(self, message):
+        return QCoreApplication.translate('Cut elements', message)
+
+    def initAlgorithm(self, config=None):
+        self.addParameter(QgsProcessingParameterFeatureSource(self.CUTTERS, self.tr('Cutter polygons'), [QgsProcessing.TypeVectorPolygon]))
+        self.addParameter(QgsProcessingParameterMultipleLayers(self.SOURCES, self.tr('Layers to crop'), QgsProcessing.TypeVectorPolygon))
+        self.addParameter(QgsProcessingParameterVectorLayer(self.TARGET, self.tr('Target layer'), [QgsProcessing.TypeVectorPolygon]))
+        self.addParameter(QgsProcessingParameterNumber(self.CHUNK_SIZE, self.tr('Chunk size'), QgsProcessingParameterNumber.Integer, 500, False, 1))
+        self.addOutput(QgsProcessingOutputNumber(self.CUT_COUNT, self.tr('Cut polygons')))
+        self.addOutput(QgsProcessingOutputNumber(self.MODIFIED_COUNT, self.tr('Modified features')))
+
+    def commitLayers(self, layers, start_editing):
+        for layer in layers:
+            if layer.isEditable() and not layer.commitChanges():
+                raise QgsProcessingException(self.tr('Could not commit changes to {}: {}').format(layer.name(), '; '.join(layer.commitErrors())))
+            if start_editing:
+                layer.startEditing()
+
+    def processAlgorithm(self, parameters, context, feedback):
+        cutters = self.parameterAsSource(parameters, self.CUTTERS, context)
+        if cutters is None:
+            raise QgsProcessingException(self.invalidSourceError(parameters, self.CUTTERS))
+
+        sources = self.parameterAsLayerList(parameters, self.SOURCES, context)
+        target_layer = self.parameterAsVectorLayer(parameters, self.TARGET, context)
+        chunk_size = self.parameterAsInt(parameters, self.CHUNK_SIZE, context)
+
+        edited = []
+        for layer in sources + [target_layer]:
+            if layer not in edited:
+                edited.append(layer)
+
+        for layer in edited:
+            if not layer.isEditable() and not layer.startEditing():
+                raise QgsProcessingException(self.tr('Layer {} can not be edited').format(layer.name()))
+
+        # Indexes are built once and kept in sync with the edits between cutters
+        cache = indexCache()
+        request = QgsFeatureRequest().setDestinationCrs(target_layer.crs(), context.transformContext())
+        total = 100.0 / cutters.featureCount() if cutters.featureCount() else 0
+        cut_count = 0
+        modified_count = 0
+        chunk_cut = 0
+        chunk_modified = 0
+
+        try:
+            for current, cutter in enumerate(cutters.getFeatures(request)):
+                if feedback.isCanceled():
+                    break
+
+                geometry = cutter.geometry()
+                if geometry.isGeosValid() == False:
+                    geometry = geometry.makeValid()
+
+                if geometry.isNull() or geometry.isGeosValid() == False:
+                    feedback.reportError(self.tr('Skipping cutter {}, the geometry is incorrect').format(cutter.id()))
+                    continue
+
+                edits, pieces, scanned, modified = cutLayers(geometry, target_layer.crs(), sources, cache, target_layer.crs())
+                if len(pieces) > 0:
+                    target_parts = moveToTarget(edits, pieces, target_layer)
+                    applyCut(edits, target_parts, target_layer.crs(), edited)
+                    chunk_cut += 1
+                    chunk_modified += modified
+
+                if (current + 1) % chunk_size == 0:
+                    self.commitLayers(edited, True)
+                    cut_count += chunk_cut
+                    modified_count += chunk_modified
+                    chunk_cut = 0
+                    chunk_modified = 0
+
+                feedback.setProgress(int((current + 1) * total))
+
+            if not feedback.isCanceled():
+                self.commitLayers(edited, False)
+                cut_count += chunk_cut
+                modified_count += chunk_modified
+        finally:
+            # Only completed chunks are kept, a canceled or failed chunk is rolled back
+            for layer in edited:
+                if layer.isEditable():
+                    layer.rollBack()
+
+            for layer in edited:
+                if QgsProject.instance().mapLayer(layer.id()) is None:
+                    cache.release(layer)
+
+        return {self.CUT_COUNT: cut_count, self.MODIFIED_COUNT: modified_count}
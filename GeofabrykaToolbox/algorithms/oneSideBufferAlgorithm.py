@@ -0,0 +1,177 @@
+# -*- coding: utf-8 -*-
+
+# ***************************************************************************
+#   This program is free software; you can redistribute it and/or modify    *
+#   it under the terms of the GNU General Public License as published by    *
+#   the Free Software Foundation; either version 2 of the License, or       *
+#   (at your option) any later version.                                     *
+# ***************************************************************************
+#     begin                : 2019-09-17                                     *
+#     copyright            : (C) 2019 by Adrian Bocianowski                 *
+#     email                : adrian at bocianowski.com.pl                   *
+# ***************************************************************************
+
+from PyQt5.QtCore import QCoreApplication, QVariant
+
+from qgis.core import (QgsProcessing, QgsProcessingAlgorithm, QgsProcessingException, QgsProcessingParameterFeatureSource,
+                       QgsProcessingParameterField, QgsProcessingParameterNumber, QgsProcessingParameterEnum,
+                       QgsProcessingParameterMultipleLayers, QgsProcessingParameterString, QgsProcessingParameterFeatureSink,
+                       QgsFeature, QgsFeatureSink, QgsField, QgsFields, QgsWkbTypes, QgsCurve, QgsProject, NULL)
+
+from ..tools.arcLength import ArcLengthTable
+from ..tools.geometryParts import geometryParts, exteriorRing
+from ..tools.layerIndex import indexCache
+from ..tools.obstacles import clipByObstacles
+
+# Same quality and minimal part area as the interactive tool
+SEGMENTS = 20
+MIN_AREA = 0.1
+
+class OneSideBufferAlgorithm(QgsProcessingAlgorithm):
+    INPUT = 'INPUT'
+    START_FIELD = 'START_FIELD'
+    END_FIELD = 'END_FIELD'
+    WIDTH = 'WIDTH'
+    SIDE = 'SIDE'
+    OBSTACLES = 'OBSTACLES'
+    WIDTH_FIELD = 'WIDTH_FIELD'
+    OUTPUT = 'OUTPUT'
+
+    SIDE_LEFT = 0
+    SIDE_RIGHT = 1
+    SIDE_OUTSIDE = 2
+    SIDE_INSIDE = 3
+
+    def createInstance(self):
+        return OneSideBufferAlgorithm()
+
+    def displayName(self):
+        return self.tr('Add buffer')
+
+    def flags(self):
+        # Obstacles are read through the shared layer indexes of the project
+        return super().flags() | QgsProcessingAlgorithm.FlagNoThreading
+
+    def name(self):
+        return 'addbuffer'
+
+    def shortHelpString(self):
+        return self.tr('Creates single sided buffers along polygon boundaries or lines, clipped by the obstacle layers, '
+                       'like the interactive "Add Buffer" tool. For polygons the start and end fields hold distances along '
+                       'the exterior ring of the largest part, walked in the ring direction. Without them, or for line '
+                       'layers, the whole boundary or line is buffered. The width is written to the width field.')
+
+    def tr(self, message):
+        return QCoreApplication.translate('Add buffer', message)
+
+    def initAlgorithm(self, config=None):
+        self.addParameter(QgsProcessingParameterFeatureSource(self.INPUT, self.tr('Input layer'), [QgsProcessing.TypeVectorPolygon, QgsProcessing.TypeVectorLine]))
+        self.addParameter(QgsProcessingParameterField(self.START_FIELD, self.tr('Start position field'), None, self.INPUT, QgsProcessingParameterField.Numeric, optional=True))
+        self.addParameter(QgsProcessingParameterField(self.END_FIELD, self.tr('End position field'), None, self.INPUT, QgsProcessingParameterField.Numeric, optional=True))
+        self.addParameter(QgsProcessingParameterNumber(self.WIDTH, self.tr('Width'), QgsProcessingParameterNumber.Double, 5.0, False, 0.0))
+        self.addParameter(QgsProcessingParameterEnum(self.SIDE, self.tr('Side'), [self.tr('Left'), self.tr('Right'), self.tr('Outside (polygons)'), self.tr('Inside (polygons)')], False, self.SIDE_OUTSIDE))
+        self.addParameter(QgsProcessingParameterMultipleLayers(self.OBSTACLES, self.tr('Obstacle layers'), QgsProcessing.TypeVectorPolygon, optional=True))
+        self.addParameter(QgsProcessingParameterString(self.WIDTH_FIELD, self.tr('Width field'), 'SZEROKOSC'))
+        self.addParameter(QgsProcessingParameterFeatureSink(self.OUTPUT, self.tr('Buffers'), QgsProcessing.TypeVectorPolygon))
+
+    def boundaryLines(self, geometry, is_polygon, start, end):
+        if not is_polygon:
+            return [(line, None) for line in geometryParts(geometry)]
+
+        parts = geometryParts(geometry)
+        if start is None or end is None:
+            rings = [exteriorRing(part) for part in parts]
+            return [(ring, self.isClockwise(ring)) for ring in rings if ring is not None]
+
+        ring = exteriorRing(max(parts, key=lambda part: part.area()))
+        if ring is None:
+            return []
+        table = ArcLengthTable(ring)
+        start = min(max(start, 0.0), table.length)
+        end = min(max(end, 0.0), table.length)
+        if start == end:
+            return []
+        return [(table.substring(start, end), self.isClockwise(ring))]
+
+    def bufferSide(self, side, clockwise):
+        # 1 = left, 2 = right; on a clockwise ring the outside is on the left
+        if side == self.SIDE_LEFT:
+            return 1
+        if side == self.SIDE_RIGHT:
+            return 2
+        if (side == self.SIDE_OUTSIDE) == clockwise:
+            return 1
+        return 2
+
+    def isClockwise(self, ring):
+        return ring.constGet().orientation() == QgsCurve.Clockwise
+
+    def processAlgorithm(self, parameters, context, feedback):
+        source = self.parameterAsSource(parameters, self.INPUT, context)
+        if source is None:
+            raise QgsProcessingException(self.invalidSourceError(parameters, self.INPUT))
+
+        start_field = self.parameterAsString(parameters, self.START_FIELD, context)
+        end_field = self.parameterAsString(parameters, self.END_FIELD, context)
+        width = self.parameterAsDouble(parameters, self.WIDTH, context)
+        side = self.parameterAsEnum(parameters, self.SIDE, context)
+        obstacles = self.parameterAsLayerList(parameters, self.OBSTACLES, context)
+        width_field = self.parameterAsString(parameters, self.WIDTH_FIELD, context)
+
+        is_polygon = QgsWkbTypes.geometryType(source.wkbType()) == QgsWkbTypes.PolygonGeometry
+        if not is_polygon and side in (self.SIDE_OUTSIDE, self.SIDE_INSIDE):
+            raise QgsProcessingException(self.tr('Outside and inside sides are available only for polygon layers'))
+
+        fields = QgsFields(source.fields())
+        if width_field and fields.indexFromName(width_field) == -1:
+            fields.append(QgsField(width_field, QVariant.Double))
+        width_idx = fields.indexFromName(width_field) if width_field else -1
+
+        (sink, dest_id) = self.parameterAsSink(parameters, self.OUTPUT, context, fields, QgsWkbTypes.Polygon, source.sourceCrs())
+        if sink is None:
+            raise QgsProcessingException(self.invalidSinkError(parameters, self.OUTPUT))
+
+        start_idx = source.fields().indexFromName(start_field) if start_field else -1
+        end_idx = source.fields().indexFromName(end_field) if end_field else -1
+        crs = source.sourceCrs()
+        total = 100.0 / source.featureCount() if source.featureCount() else 0
+
+        for current, feature in enumerate(source.getFeatures()):
+            if feedback.isCanceled():
+                break
+
+            if not feature.hasGeometry():
+                continue
+
+            start = end = None
+            if start_idx != -1 and end_idx != -1 and feature[start_idx] != NULL and feature[end_idx] != NULL:
+                start = float(feature[start_idx])
+                end = float(feature[end_idx])
+
+            attributes = feature.attributes() + [None] * (fields.count() - len(feature.attributes()))
+            if width_idx != -1:
+                attributes[width_idx] = width
+
+            for line, clockwise in self.boundaryLines(feature.geometry(), is_polygon, start, end):
+                buffer_geom = line.singleSidedBuffer(width, SEGMENTS, self.bufferSide(side, clockwise), 2)
+                # Obstacle indexes are built on the first feature and reused for the whole run
+                buffer_geom = clipByObstacles(buffer_geom, crs, obstacles, False)
+
+                for part_geom in geometryParts(buffer_geom):
+                    if part_geom.isGeosValid() == False:
+                        part_geom = part_geom.makeValid()
+
+                    if part_geom.isGeosValid() == True and part_geom.area() > MIN_AREA:
+                        output = QgsFeature(fields)
+                        output.setGeometry(part_geom)
+                        output.setAttributes(attributes)
+                        sink.addFeature(output, QgsFeatureSink.FastInsert)
+
+            feedback.setProgress(int((current + 1) * total))
+
+        cache = indexCache()
+        for layer in obstacles:
+            if QgsProject.instance().mapLayer(layer.id()) is None:
+                cache.release(layer)
+
+        return {self.OUTPUT: dest_id}
@@ -0,0 +1,38 @@
+# -*- coding: utf-8 -*-
+
+# ***************************************************************************
+#   This program is free software; you can redistribute it and/or modify    *
+#   it under the terms of the GNU General Public License as published by    *
+#   the Free Software Foundation; either version 2 of the License, or       *
+#   (at your option) any later version.                                     *
+# ***************************************************************************
+#     begin                : 2019-09-17                                     *
+#     copyright            : (C) 2019 by Adrian Bocianowski                 *
+#     email                : adrian at bocianowski.com.pl                   *
+# ***************************************************************************
+
+from PyQt5.QtGui import QIcon
+
+from qgis.core import QgsProcessingProvider
+
+from .cutAlgorithm import CutAlgorithm
+from .oneSideBufferAlgorithm import OneSideBufferAlgorithm
+from .seedFillAlgorithm import SeedFillAlgorithm
+
+class GeofabrykaProvider(QgsProcessingProvider):
+    def icon(self):
+        return QIcon(':/plugins/GeofabrykaToolbox/icons/geofabryka.png')
+
+    def id(self):
+        return 'geofabrykatoolbox'
+
+    def loadAlgorithms(self):
+        self.addAlgorithm(CutAlgorithm())
+        self.addAlgorithm(OneSideBufferAlgorithm())
+        self.addAlgorithm(SeedFillAlgorithm())
+
+    def longName(self):
+        return self.name()
+
+    def name(self):
+        return 'Geofabryka Toolbox'
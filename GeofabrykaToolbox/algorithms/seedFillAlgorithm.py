@@ -0,0 +1,128 @@
+# -*- coding: utf-8 -*-
+
+# ***************************************************************************
+#   This program is free software; you can redistribute it and/or modify    *
+#   it under the terms of the GNU General Public License as published by    *
+#   the Free Software Foundation; either version 2 of the License, or       *
+#   (at your option) any later version.                                     *
+# ***************************************************************************
+#     begin                : 2019-09-17                                     *
+#     copyright            : (C) 2019 by Adrian Bocianowski                 *
+#     email                : adrian at bocianowski.com.pl                   *
+# ***************************************************************************
+
+from PyQt5.QtCore import QCoreApplication
+
+from qgis.core import (QgsProcessing, QgsProcessingAlgorithm, QgsProcessingException, QgsProcessingParameterFeatureSource,
+                       QgsProcessingParameterMultipleLayers, QgsProcessingParameterVectorLayer, QgsProcessingParameterNumber,
+                       QgsProcessingParameterBoolean, QgsProcessingOutputNumber, QgsFeatureRequest, QgsProject, QgsVectorLayerUtils)
+
+from ..tools.fillEngine import fillAt
+from ..tools.layerIndex import indexCache
+from ..tools.lineNetwork import LineNetwork, TILE_FACTOR
+from ..tools.topology import addTopologicalPoints
+
+class SeedFillAlgorithm(QgsProcessingAlgorithm):
+    SEEDS = 'SEEDS'
+    POLYGONS = 'POLYGONS'
+    LINES = 'LINES'
+    SEARCH_AREA = 'SEARCH_AREA'
+    EXPAND = 'EXPAND'
+    TARGET = 'TARGET'
+    FILLED_COUNT = 'FILLED_COUNT'
+    SKIPPED_COUNT = 'SKIPPED_COUNT'
+
+    def createInstance(self):
+        return SeedFillAlgorithm()
+
+    def displayName(self):
+        return self.tr('Fill the empty spaces from points')
+
+    def flags(self):
+        # The target layer is edited in place and the restrictive indexes follow its edits
+        return super().flags() | QgsProcessingAlgorithm.FlagNoThreading
+
+    def name(self):
+        return 'fillemptyspacesfrompoints'
+
+    def shortHelpString(self):
+        return self.tr('Fills the empty space around every seed point, like a click of the interactive "Fill the empty spaces" tool, '
+                       'and saves it in the target layer. Seeds inside a restrictive polygon, including a space filled by an '
+                       'earlier seed when the target layer is restrictive too, are skipped. The search area is in target layer units; when expanding, it is doubled while the space still touches its border.')
+
+    def tr(self, message):
+        return QCoreApplication.translate('Fill the empty spaces', message)
+
+    def initAlgorithm(self, config=None):
+        self.addParameter(QgsProcessingParameterFeatureSource(self.SEEDS, self.tr('Seed points'), [QgsProcessing.TypeVectorPoint]))
+        self.addParameter(QgsProcessingParameterMultipleLayers(self.POLYGONS, self.tr('Restrictive polygon layers'), QgsProcessing.TypeVectorPolygon, optional=True))
+        self.addParameter(QgsProcessingParameterMultipleLayers(self.LINES, self.tr('Restrictive line layers'), QgsProcessing.TypeVectorLine, optional=True))
+        self.addParameter(QgsProcessingParameterNumber(self.SEARCH_AREA, self.tr('Search area'), QgsProcessingParameterNumber.Double, 100.0, False, 1.0))
+        self.addParameter(QgsProcessingParameterBoolean(self.EXPAND, self.tr('Expand search area'), True))
+        self.addParameter(QgsProcessingParameterVectorLayer(self.TARGET, self.tr('Target layer'), [QgsProcessing.TypeVectorPolygon]))
+        self.addOutput(QgsProcessingOutputNumber(self.FILLED_COUNT, self.tr('Filled spaces')))
+        self.addOutput(QgsProcessingOutputNumber(self.SKIPPED_COUNT, self.tr('Skipped seeds')))
+
+    def processAlgorithm(self, parameters, context, feedback):
+        seeds = self.parameterAsSource(parameters, self.SEEDS, context)
+        if seeds is None:
+            raise QgsProcessingException(self.invalidSourceError(parameters, self.SEEDS))
+
+        polygon_layers = self.parameterAsLayerList(parameters, self.POLYGONS, context)
+        line_layers = self.parameterAsLayerList(parameters, self.LINES, context)
+        radius = self.parameterAsDouble(parameters, self.SEARCH_AREA, context)
+        expand = self.parameterAsBool(parameters, self.EXPAND, context)
+        target_layer = self.parameterAsVectorLayer(parameters, self.TARGET, context)
+
+        if len(polygon_layers) == 0 and len(line_layers) == 0:
+            raise QgsProcessingException(self.tr('Select at least one restrictive layer'))
+
+        if not target_layer.isEditable() and not target_layer.startEditing():
+            raise QgsProcessingException(self.tr('Layer {} can not be edited').format(target_layer.name()))
+
+        crs = target_layer.crs()
+        # One line network for the whole run, the seeds are visited tile by tile so nearby seeds share its faces
+        tile_size = radius * TILE_FACTOR
+        network = LineNetwork(line_layers, crs, tile_size) if len(line_layers) > 0 else None
+
+        request = QgsFeatureRequest().setNoAttributes().setDestinationCrs(crs, context.transformContext())
+        points = []
+        for seed in seeds.getFeatures(request):
+            if seed.hasGeometry():
+                for point in seed.geometry().asMultiPoint() if seed.geometry().isMultipart() else [seed.geometry().asPoint()]:
+                    points.append(point)
+        points.sort(key=lambda p: (int(p.x() // tile_size), int(p.y() // tile_size)))
+
+        total = 100.0 / len(points) if len(points) else 0
+        filled_count = 0
+        skipped_count = 0
+
+        for current, point in enumerate(points):
+            if feedback.isCanceled():
+                break
+
+            target_geom = fillAt(point, crs, polygon_layers, network, radius, expand)
+            if target_geom == None:
+                skipped_count += 1
+            else:
+                feature = QgsVectorLayerUtils.createFeature(target_layer)
+                feature.setGeometry(target_geom)
+                target_layer.addFeature(feature)
+                addTopologicalPoints(target_geom, polygon_layers, crs)
+                filled_count += 1
+
+            feedback.setProgress(int((current + 1) * total))
+
+        if network is not None:
+            network.release()
+
+        for layer in [target_layer] + polygon_layers:
+            if layer.isEditable() and layer.isModified() and not layer.commitChanges():
+                raise QgsProcessingException(self.tr('Could not commit changes to {}: {}').format(layer.name(), '; '.join(layer.commitErrors())))
+
+        cache = indexCache()
+        for layer in [target_layer] + polygon_layers + line_layers:
+            if QgsProject.instance().mapLayer(layer.id()) is None:
+                cache.release(layer)
+
+        return {self.FILLED_COUNT: filled_count, self.SKIPPED_COUNT: skipped_count}
@@ -0,0 +1,59 @@
+# -*- coding: utf-8 -*-
+
+# ***************************************************************************
+#   This program is free software; you can redistribute it and/or modify    *
+#   it under the terms of the GNU General Public License as published by    *
+#   the Free Software Foundation; either version 2 of the License, or       *
+#   (at your option) any later version.                                     *
+# ***************************************************************************
+#     begin                : 2019-09-17                                     *
+#     copyright            : (C) 2019 by Adrian Bocianowski                 *
+#     email                : adrian at bocianowski.com.pl                   *
+# ***************************************************************************
+
+import numpy as np
+
+from qgis.core import QgsGeometry, QgsLineString
+
+class ArcLengthTable:
+    def __init__(self, linestring):
+        # Cumulative distance of every vertex from the line start, built once per line
+        points = linestring.asPolyline()
+        self.x = np.array([p.x() for p in points], dtype=float)
+        self.y = np.array([p.y() for p in points], dtype=float)
+        self.cumulative = np.concatenate(([0.0], np.cumsum(np.hypot(np.diff(self.x), np.diff(self.y)))))
+        self.length = float(self.cumulative[-1])
+
+    def interpolate(self, distance):
+        i = int(np.searchsorted(self.cumulative, distance, side='right')) - 1
+        i = min(max(i, 0), len(self.cumulative) - 2)
+        segment = self.cumulative[i + 1] - self.cumulative[i]
+        t = 0.0 if segment == 0 else (distance - self.cumulative[i]) / segment
+        return self.x[i] + t * (self.x[i + 1] - self.x[i]), self.y[i] + t * (self.y[i + 1] - self.y[i])
+
+    def forwardLength(self, start, end):
+        # Length walked from start to end along a closed ring
+        if start <= end:
+            return end - start
+        return self.length - start + end
+
+    def section(self, start, end):
+        # Vertices strictly between start and end, with both interpolated ends
+        first = int(np.searchsorted(self.cumulative, start, side='right'))
+        last = int(np.searchsorted(self.cumulative, end, side='left'))
+        start_x, start_y = self.interpolate(start)
+        end_x, end_y = self.interpolate(end)
+        xs = np.concatenate(([start_x], self.x[first:last], [end_x]))
+        ys = np.concatenate(([start_y], self.y[first:last], [end_y]))
+        return xs, ys
+
+    def substring(self, start, end):
+        # Walks forward from start to end, wrapping through the ring start when start > end
+        if start <= end:
+            xs, ys = self.section(start, end)
+        else:
+            xs_1, ys_1 = self.section(start, self.length)
+            xs_2, ys_2 = self.section(0.0, end)
+            xs = np.concatenate((xs_1, xs_2[1:]))
+            ys = np.concatenate((ys_1, ys_2[1:]))
+        return QgsGeometry(QgsLineString(xs.tolist(), ys.tolist()))
@@ -18,8 +18,10 @@ from PyQt5.QtGui import QIcon, QColor
 from PyQt5.QtWidgets import QAction, QWidget, QTableWidgetItem, QPushButton, QMessageBox
 from PyQt5 import uic, QtWidgets
 
-from qgis.core import QgsProject,QgsSpatialIndex,QgsPointXY, QgsGeometry, QgsField, QgsVectorLayer, QgsLayerTreeLayer, QgsFeature, NULL, QgsMapLayerType
+from qgis.core import QgsProject,QgsSpatialIndex,QgsPointXY, QgsGeometry, QgsField, QgsVectorLayer, QgsLayerTreeLayer, QgsFeature, NULL, QgsMapLayerType, QgsCoordinateTransform
 from ..dialogs.attributes_join_by_line import AttributesJoinByLineDialog
+from .topology import TOLERANCE
+from .transforms import transformCache
 
 class AttributesJoinByLine(QWidget):
     def __init__(self, iface, plugin_dir, mainToolbar, icon_path):
@@ -327,6 +329,14 @@ class worker(QThread):
 
         self.stopTask = False
 
+        # Transforms are taken from the cache here, in the main thread
+        self.targetToConnecting = None
+        self.connectingToSource = None
+        if not transformCache().isSame(targetLayer.crs(), connectingLayer.crs()):
+            self.targetToConnecting = QgsCoordinateTransform(transformCache().transform(targetLayer.crs(), connectingLayer.crs()))
+        if not transformCache().isSame(connectingLayer.crs(), sourceLayer.crs()):
+            self.connectingToSource = QgsCoordinateTransform(transformCache().transform(connectingLayer.crs(), sourceLayer.crs()))
+
         self.redColor = QColor(255, 0, 0)
         self.greenColor = QColor(34, 139, 34)
         self.prg = 0
@@ -347,7 +357,11 @@ class worker(QThread):
                 break
                 return
             
-            targetGeometry = targetPointfeature.geometry().asPoint()
+            targetPointGeometry = targetPointfeature.geometry()
+            if self.targetToConnecting is not None:
+                targetPointGeometry.transform(self.targetToConnecting)
+
+            targetGeometry = targetPointGeometry.asPoint()
             nearestLinesIdx = connectinglayer_index.nearestNeighbor(targetGeometry,0)
             nearestLinesIdxCount = len(nearestLinesIdx)
 
@@ -360,7 +374,12 @@ class worker(QThread):
             lineTouches = []
             for line in nearestLinesIdx:
                 linegeometry = self.connectingLayer.getFeature(line).geometry().mergeLines()
-                if linegeometry.intersects(targetPointfeature.geometry()):
+                # A reprojected point never lands exactly on the line vertex, it only has to be close to it
+                if self.targetToConnecting is not None:
+                    touches = linegeometry.distance(targetPointGeometry) < TOLERANCE
+                else:
+                    touches = linegeometry.intersects(targetPointGeometry)
+                if touches:
                     try:
                         linegeometry = linegeometry.asPolyline()
                     except:
@@ -378,6 +397,8 @@ class worker(QThread):
                 nearestSourcePoints = []
                 for line in lineTouches:
                     for point in line:
+                        if self.connectingToSource is not None:
+                            point = self.connectingToSource.transform(point)
                         nearestSourcePoint = sourcePoint_index.nearestNeighbor(point,0)
                         if nearestSourcePoint != []:
                             nearestSourcePoints.append(nearestSourcePoint)
@@ -0,0 +1,211 @@
+# -*- coding: utf-8 -*-
+
+# ***************************************************************************
+#   This program is free software; you can redistribute it and/or modify    *
+#   it under the terms of the GNU General Public License as published by    *
+#   the Free Software Foundation; either version 2 of the License, or       *
+#   (at your option) any later version.                                     *
+# ***************************************************************************
+#     begin                : 2019-09-17                                     *
+#     copyright            : (C) 2019 by Adrian Bocianowski                 *
+#     email                : adrian at bocianowski.com.pl                   *
+# ***************************************************************************
+
+from qgis.core import QgsGeometry, QgsFeature, QgsFeatureRequest
+
+from .geometryParts import geometryParts
+from .topology import addTopologicalPoints
+from .transforms import transformGeometry
+
+class CutEngine:
+    def __init__(self, geometries):
+        # Every cut area is prepared once and reused for all candidates
+        if isinstance(geometries, QgsGeometry):
+            geometries = [geometries]
+
+        self.cutters = [PreparedCutter(g) for g in geometries]
+
+    def cutLayer(self, layer, index, source=None, task=None):
+        # source is a thread safe feature source and task a running QgsTask when cutting in the background
+        if source is None:
+            source = layer
+
+        result = CutResult(layer)
+
+        # Every cut area queries the index on its own bbox, queued areas spread over the map
+        # do not pull in everything between them
+        bbox_hits = {}
+        for i, cutter in enumerate(self.cutters):
+            for fid in index.intersects(cutter.bbox):
+                bbox_hits.setdefault(fid, []).append(i)
+        result.scanned = len(bbox_hits)
+
+        # Stored index geometries reject false bbox hits without fetching features,
+        # candidates are fetched once for all queued cut areas
+        cutter_hits = {}
+        for fid, cutters in bbox_hits.items():
+            f_geom = index.geometry(fid)
+            hit = [i for i in cutters if self.cutters[i].engine.intersects(f_geom.constGet())]
+            if len(hit) > 0:
+                cutter_hits[fid] = hit
+
+        if len(cutter_hits) == 0:
+            return result
+
+        hits = list(cutter_hits.keys())
+
+        request = QgsFeatureRequest().setFilterFids(hits)
+        for i, f in enumerate(source.getFeatures(request)):
+            if task is not None:
+                if task.isCanceled():
+                    return None
+                task.setProgress(100.0 * i / len(hits))
+
+            f_geom = f.geometry()
+
+            for cutter in [self.cutters[c] for c in cutter_hits.get(f.id(), [])]:
+                if f_geom.isNull() or f_geom.isEmpty():
+                    break
+
+                if not cutter.engine.intersects(f_geom.constGet()):
+                    continue
+
+                if cutter.engine.contains(f_geom.constGet()):
+                    result.pieces.append(f_geom)
+                    f_geom = QgsGeometry()
+                else:
+                    result.pieces.append(QgsGeometry(cutter.engine.intersection(f_geom.constGet())))
+                    f_geom = f_geom.difference(cutter.geometry)
+
+            att = f.attributes()
+            for part_geom in geometryParts(f_geom):
+                new_feature = QgsFeature()
+                new_feature.setGeometry(part_geom)
+                new_feature.setAttributes(att)
+                result.additions.append(new_feature)
+
+            result.deletions.append(f.id())
+
+        result.modified = len(result.deletions)
+        return result
+
+class PreparedCutter():
+    def __init__(self, geometry):
+        self.geometry = QgsGeometry(geometry)
+        self.bbox = self.geometry.boundingBox()
+        self.engine = QgsGeometry.createGeometryEngine(self.geometry.constGet())
+        self.engine.prepareGeometry()
+
+def cutLayers(geometry, crs, layers, cache, target_crs):
+    # geometry is in crs, each layer is cut in its own CRS and pieces come back in target_crs
+    edits = CutEdits()
+    pieces = []
+    scanned = 0
+    modified = 0
+
+    for layer in layers:
+        engine = CutEngine(transformGeometry(geometry, crs, layer.crs()))
+        result = engine.cutLayer(layer, cache.index(layer))
+        scanned += result.scanned
+        modified += result.modified
+        pieces.extend([transformGeometry(p, layer.crs(), target_crs) for p in result.pieces])
+        edits.addResult(result)
+
+    return edits, pieces, scanned, modified
+
+def moveToTarget(edits, pieces, target_layer):
+    target_parts = []
+    if len(pieces) == 0:
+        return target_parts
+
+    target_geom = QgsGeometry.unaryUnion(pieces)
+    for part_geom in geometryParts(target_geom):
+        feature = QgsFeature(target_layer.fields())
+        feature.setGeometry(part_geom)
+        target_parts.append(part_geom)
+        edits.addFeatures(target_layer, [feature])
+
+    return target_parts
+
+def applyCut(edits, target_parts, target_crs, topology_layers, text='Cut elements'):
+    # The whole cut is a single undo step on every edited layer
+    edits.beginEditCommand(text)
+    try:
+        edits.apply()
+        for part_geom in target_parts:
+            addTopologicalPoints(part_geom, topology_layers, target_crs, edits.join)
+    except Exception:
+        edits.destroyEditCommand()
+        raise
+    edits.endEditCommand()
+
+class CutResult():
+    def __init__(self, layer):
+        self.layer = layer
+        self.additions = []
+        self.deletions = []
+        self.pieces = []
+        self.scanned = 0
+        self.modified = 0
+
+class CutEdits():
+    def __init__(self):
+        self.layers = {}
+        self.additions = {}
+        self.deletions = {}
+        self.commandText = None
+
+    def addFeatures(self, layer, features):
+        self.register(layer)
+        self.additions[layer.id()].extend(features)
+
+    def addResult(self, result):
+        if len(result.additions) == 0 and len(result.deletions) == 0:
+            return
+        self.addFeatures(result.layer, result.additions)
+        self.deleteFeatures(result.layer, result.deletions)
+
+    def apply(self):
+        # One bulk call per layer instead of a signal round per feature
+        for layer_id, layer in self.layers.items():
+            if len(self.deletions[layer_id]) > 0:
+                layer.deleteFeatures(self.deletions[layer_id])
+            if len(self.additions[layer_id]) > 0:
+                layer.addFeatures(self.additions[layer_id])
+
+    def beginEditCommand(self, text):
+        self.commandText = text
+        for layer in self.layers.values():
+            if not layer.isEditable():
+                layer.startEditing()
+            layer.beginEditCommand(text)
+
+    def deleteFeatures(self, layer, fids):
+        self.register(layer)
+        self.deletions[layer.id()].extend(fids)
+
+    def destroyEditCommand(self):
+        self.commandText = None
+        for layer in self.layers.values():
+            layer.destroyEditCommand()
+
+    def endEditCommand(self):
+        self.commandText = None
+        for layer in self.layers.values():
+            layer.endEditCommand()
+
+    def join(self, layer):
+        # Layers edited only by the topology points join the running edit command
+        if layer.id() in self.layers:
+            return
+        self.register(layer)
+        if self.commandText is not None:
+            if not layer.isEditable():
+                layer.startEditing()
+            layer.beginEditCommand(self.commandText)
+
+    def register(self, layer):
+        if layer.id() not in self.layers:
+            self.layers[layer.id()] = layer
+            self.additions[layer.id()] = []
+            self.deletions[layer.id()] = []
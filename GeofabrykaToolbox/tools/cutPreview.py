@@ -0,0 +1,202 @@
+# -*- coding: utf-8 -*-
+
+# ***************************************************************************
+#   This program is free software; you can redistribute it and/or modify    *
+#   it under the terms of the GNU General Public License as published by    *
+#   the Free Software Foundation; either version 2 of the License, or       *
+#   (at your option) any later version.                                     *
+# ***************************************************************************
+#     begin                : 2019-09-17                                     *
+#     copyright            : (C) 2019 by Adrian Bocianowski                 *
+#     email                : adrian at bocianowski.com.pl                   *
+# ***************************************************************************
+
+from PyQt5.QtCore import QElapsedTimer, QTimer
+from PyQt5.QtGui import QColor
+
+from qgis.gui import QgsRubberBand
+from qgis.core import QgsWkbTypes, QgsGeometry, QgsFeature, QgsFeatureRequest, QgsPointXY, QgsRectangle, QgsSpatialIndex
+
+from .transforms import transformGeometry, transformRect
+
+# Debounce interval and work budget per timer tick, in ms
+DEBOUNCE = 10
+BUDGET = 12
+# Cached area around the view, so small pans keep the cache
+CACHE_SCALE = 2
+
+class CutPreview:
+    def __init__(self, canvas, layers):
+        # layers is a callable returning the selected source layers
+        self.canvas = canvas
+        self.layers = layers
+        self.enabled = False
+        self.connectedLayers = set()
+
+        color = QColor(255,200,0)
+        color_alpha = QColor(255,200,0)
+        color_alpha.setAlpha(90)
+        self.rubberBand = QgsRubberBand(self.canvas,QgsWkbTypes.GeometryType(3))
+        self.rubberBand.setWidth(2)
+        self.rubberBand.setStrokeColor(color)
+        self.rubberBand.setFillColor(color_alpha)
+
+        self.timer = QTimer()
+        self.timer.setSingleShot(True)
+        self.timer.setInterval(DEBOUNCE)
+        self.timer.timeout.connect(self.process)
+
+        self.canvas.extentsChanged.connect(self.extentChanged)
+
+        self.points = None
+        self.cursor = None
+        self.fixedCount = 0
+        self.polygon = None
+        self.dirty = False
+        self.hits = None
+        self.found = set()
+        self.invalidate()
+
+    def buildStep(self, timer):
+        # Candidates of the view are indexed with local ids, across timer ticks within the budget
+        canvas_crs = self.canvas.mapSettings().destinationCrs()
+        feature = QgsFeature()
+
+        while True:
+            if self.building is None:
+                if len(self.buildLayers) == 0:
+                    self.ready = True
+                    return True
+                layer = self.buildLayers.pop(0)
+                self.connectLayer(layer)
+                # Cached geometries are kept in the canvas CRS
+                request = QgsFeatureRequest().setFilterRect(transformRect(self.cacheExtent, canvas_crs, layer.crs())).setNoAttributes()
+                self.building = (layer, layer.getFeatures(request))
+
+            layer, iterator = self.building
+            while iterator.nextFeature(feature):
+                if feature.hasGeometry():
+                    key = len(self.cache)
+                    geometry = transformGeometry(feature.geometry(), layer.crs(), canvas_crs)
+                    self.cache[key] = (layer, geometry)
+                    self.index.addFeature(key, geometry.boundingBox())
+                if timer.elapsed() >= BUDGET:
+                    return False
+            self.building = None
+
+    def clear(self):
+        self.timer.stop()
+        self.points = None
+        self.polygon = None
+        self.queue = None
+        self.found = set()
+        self.hits = None
+        self.rubberBand.reset(QgsWkbTypes.GeometryType(3))
+
+    def connectLayer(self, layer):
+        # Edits of a cached layer rebuild the cache
+        if layer.id() in self.connectedLayers:
+            return
+        self.connectedLayers.add(layer.id())
+        layer.featureAdded.connect(self.dataChanged)
+        layer.featureDeleted.connect(self.dataChanged)
+        layer.geometryChanged.connect(self.dataChanged)
+        layer.afterRollBack.connect(self.dataChanged)
+        layer.dataSourceChanged.connect(self.dataChanged)
+
+    def dataChanged(self, *args):
+        self.invalidate()
+
+    def extentChanged(self):
+        if self.cacheExtent is None or not self.cacheExtent.contains(self.canvas.extent()):
+            self.invalidate()
+
+    def invalidate(self):
+        self.cache = None
+        self.cacheExtent = None
+        self.building = None
+        self.ready = False
+        self.queue = None
+        if self.enabled and self.points is not None:
+            self.timer.start(DEBOUNCE)
+
+    def process(self):
+        if self.points is None:
+            return
+
+        timer = QElapsedTimer()
+        timer.start()
+
+        # The polygon and its prepared engine are rebuilt once per debounced update, not per mouse move
+        if self.dirty:
+            self.polygon = QgsGeometry.fromPolygonXY([self.points + [self.cursor]])
+            self.engine = QgsGeometry.createGeometryEngine(self.polygon.constGet())
+            self.engine.prepareGeometry()
+            self.dirty = False
+
+        if self.cache is None:
+            self.cache = {}
+            self.index = QgsSpatialIndex()
+            self.cacheExtent = self.canvas.extent()
+            self.cacheExtent.scale(CACHE_SCALE)
+            self.buildLayers = list(self.layers())
+            # Keys of the new cache do not match the drawn ones
+            self.hits = None
+
+        if not self.ready:
+            if not self.buildStep(timer):
+                self.timer.start(0)
+                return
+            self.queue = None
+
+        if self.queue is None:
+            # Full check of the polygon, later updates only recheck what changed
+            self.queue = set(self.index.intersects(self.polygon.boundingBox()))
+            self.found = set()
+
+        while len(self.queue) > 0:
+            key = self.queue.pop()
+            if self.engine.intersects(self.cache[key][1].constGet()):
+                self.found.add(key)
+            else:
+                self.found.discard(key)
+            if timer.elapsed() >= BUDGET:
+                self.timer.start(0)
+                return
+
+        if self.found != self.hits:
+            self.hits = set(self.found)
+            self.render()
+
+    def render(self):
+        self.rubberBand.reset(QgsWkbTypes.GeometryType(3))
+        for key in self.hits:
+            layer, geometry = self.cache[key]
+            self.rubberBand.addGeometry(geometry, None)
+        self.rubberBand.show()
+
+    def setEnabled(self, enabled):
+        self.enabled = enabled
+        if not enabled:
+            self.clear()
+            self.invalidate()
+
+    def update(self, points, cursor):
+        # points is the vertex list of the tool, it is only read when the preview is processed
+        if not self.enabled:
+            return
+
+        if self.points is None or not self.ready or self.queue is None or len(points) < self.fixedCount:
+            self.queue = None
+        else:
+            # Only the corner between the last fixed vertex, the old and the new cursor and the first vertex changed
+            rect = QgsRectangle(self.cursor, cursor)
+            for point in points[max(self.fixedCount - 1, 0):] + points[:1]:
+                rect.combineExtentWith(point.x(), point.y())
+            self.queue |= set(self.index.intersects(rect))
+
+        self.points = points
+        self.fixedCount = len(points)
+        self.cursor = QgsPointXY(cursor)
+        self.dirty = True
+        self.timer.start(DEBOUNCE)
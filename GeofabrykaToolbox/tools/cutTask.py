@@ -0,0 +1,113 @@
+# -*- coding: utf-8 -*-
+
+# ***************************************************************************
+#   This program is free software; you can redistribute it and/or modify    *
+#   it under the terms of the GNU General Public License as published by    *
+#   the Free Software Foundation; either version 2 of the License, or       *
+#   (at your option) any later version.                                     *
+# ***************************************************************************
+#     begin                : 2019-09-17                                     *
+#     copyright            : (C) 2019 by Adrian Bocianowski                 *
+#     email                : adrian at bocianowski.com.pl                   *
+# ***************************************************************************
+
+from PyQt5.QtCore import pyqtSignal
+
+from qgis.core import QgsTask, QgsFeedback, QgsGeometry, QgsCoordinateTransform, QgsVectorLayerFeatureSource
+
+from .cutEngine import CutEngine, CutEdits, moveToTarget, applyCut
+from .layerIndex import buildIndex
+from .layerTask import LayerTask
+from .transforms import transformCache, transformGeometry
+
+class CutTask(LayerTask):
+    cutFinished = pyqtSignal(int, int)
+    cutFailed = pyqtSignal(str)
+
+    def __init__(self, geometries, crs, layers, target_layer, topology_layers, cache):
+        QgsTask.__init__(self, 'Cut elements', QgsTask.CanCancel)
+        self.target_layer = target_layer
+        self.topology_layers = topology_layers
+        self.cache = cache
+        self.layers = layers
+        self.subTasks = []
+        self.watchLayers(layers)
+
+        # One subtask per source layer, the parent only starts when all of them are done
+        for layer in layers:
+            task = CutLayerTask(geometries, crs, layer, target_layer.crs(), cache.indexes.get(layer.id()))
+            self.subTasks.append(task)
+            self.addSubTask(task, [], QgsTask.ParentDependsOnSubTask)
+
+    def finished(self, result):
+        # Called in the main thread, edits are applied here
+        self.disconnectLayers()
+
+        if not result or any(t.result is None for t in self.subTasks):
+            self.cutFailed.emit('The cut was canceled')
+            return
+
+        if len(self.modifiedLayers) > 0:
+            self.cutFailed.emit('Source layers were edited while the cut was computed, repeat the cut')
+            return
+
+        edits = CutEdits()
+        pieces = []
+        scanned = 0
+        modified = 0
+
+        for task in self.subTasks:
+            if task.builtIndex:
+                self.cache.adopt(task.layer, task.index)
+            scanned += task.result.scanned
+            modified += task.result.modified
+            pieces.extend(task.result.pieces)
+            edits.addResult(task.result)
+
+        if len(pieces) > 0:
+            target_parts = moveToTarget(edits, pieces, self.target_layer)
+            applyCut(edits, target_parts, self.target_layer.crs(), self.topology_layers)
+
+        self.cutFinished.emit(scanned, modified)
+
+    def run(self):
+        return not self.isCanceled()
+
+class CutLayerTask(QgsTask):
+    def __init__(self, geometries, crs, layer, target_crs, index):
+        QgsTask.__init__(self, 'Cut {}'.format(layer.name()), QgsTask.CanCancel)
+        if isinstance(geometries, QgsGeometry):
+            geometries = [geometries]
+        # Transforms come from the cache in the main thread, the task only applies them
+        self.geometries = [transformGeometry(g, crs, layer.crs()) for g in geometries]
+        self.pieceTransform = None
+        if not transformCache().isSame(layer.crs(), target_crs):
+            self.pieceTransform = QgsCoordinateTransform(transformCache().transform(layer.crs(), target_crs))
+        self.layer = layer
+        self.source = QgsVectorLayerFeatureSource(layer)
+        self.index = index
+        self.builtIndex = False
+        self.feedback = QgsFeedback()
+        self.result = None
+
+    def cancel(self):
+        self.feedback.cancel()
+        QgsTask.cancel(self)
+
+    def run(self):
+        if self.index is None:
+            self.index = buildIndex(self.source, self.feedback)
+            self.builtIndex = True
+
+        if self.isCanceled():
+            return False
+
+        engine = CutEngine(self.geometries)
+        self.result = engine.cutLayer(self.layer, self.index, self.source, self)
+        if self.result is None:
+            return False
+
+        if self.pieceTransform is not None:
+            for piece in self.result.pieces:
+                piece.transform(self.pieceTransform)
+        return True
@@ -11,16 +11,21 @@
 #     email                : adrian at bocianowski.com.pl                   *
 # ***************************************************************************
 
+import math
 import os
 from ..resources import *
 from ..dialogs.cutter_settingsPanel import settingsPanel
+from .cutPreview import CutPreview
+from .cutTask import CutTask
+from .layerIndex import indexCache
+from .snapping import snappingService
 
-from PyQt5.QtCore import QSettings, QCoreApplication, Qt, pyqtSignal
+from PyQt5.QtCore import QSettings, QCoreApplication, QElapsedTimer, Qt, pyqtSignal
 from PyQt5.QtGui import QIcon, QColor
 from PyQt5.QtWidgets import  QToolButton, QMenu, QAction, QListWidgetItem, QMessageBox
 
 from qgis.gui import QgsMapTool, QgsVertexMarker, QgsRubberBand
-from qgis.core import QgsWkbTypes, QgsGeometry, QgsProject, QgsCoordinateReferenceSystem, QgsCoordinateTransform, QgsFeature, QgsVectorLayerEditUtils
+from qgis.core import Qgis, QgsApplication, QgsMessageLog, QgsWkbTypes, QgsGeometry, QgsProject
 
 class Cutter:
     def __init__(self, iface, plugin_dir, toolbar, icon_path):
@@ -46,6 +51,13 @@ class Cutter:
         self.settingsWidget = settingsPanel() 
         self.settingsWidget.showButton.clicked.connect(self.clickShowAll)
         self.settingsWidget.hideButton.clicked.connect(self.clickHideAll)
+        self.settingsWidget.checkBox_queue.stateChanged.connect(self.clickQueue)
+        self.settingsWidget.applyButton.clicked.connect(self.applyQueue)
+        self.settingsWidget.checkBox_preview.stateChanged.connect(self.clickPreview)
+        self.settingsWidget.checkBox_stream.stateChanged.connect(self.streamSettingsChanged)
+        self.settingsWidget.spinBox_streamTolerance.valueChanged.connect(self.streamSettingsChanged)
+        self.settingsWidget.spinBox_streamInterval.valueChanged.connect(self.streamSettingsChanged)
+        self.settingsWidget.listWidget.itemChanged.connect(self.sourceLayersChanged)
 
         icon = QIcon(self.icon_path + 'selectAll.svg')
         self.settingsWidget.showButton.setIcon(icon)
@@ -68,9 +80,15 @@ class Cutter:
         self.rebuildComboBox()
 
         self.geometryClass = Cutter_geometry()
+        self.cutTask = None
+        self.queuedCut = False
         
         self.tool = addPolygon(self.iface, None, self.geometryClass)
         self.tool.cut.connect(self.cutLayers)
+        self.tool.queued.connect(self.queueChanged)
+        self.tool.preview = CutPreview(self.canvas, self.getLayersToCut)
+        self.tool.snapLayers = lambda: [l[0] for l in self.polygonLayers]
+        self.streamSettingsChanged()
         self.tool.deact.connect(self.settingsWidget.hide)
 
         self.initGui()
@@ -114,86 +132,77 @@ class Cutter:
 
         return action
 
+    def applyQueue(self):
+        if len(self.geometryClass.pending) == 0:
+            return
+        if self.startCut(self.geometryClass.pending):
+            self.queuedCut = True
+
+    def clickPreview(self):
+        self.tool.preview.setEnabled(self.settingsWidget.checkBox_preview.isChecked())
+
+    def clickQueue(self):
+        self.tool.queueMode = self.settingsWidget.checkBox_queue.isChecked()
+
     def cutLayers(self):
+        self.startCut([self.geometryClass.geometry])
+
+    def startCut(self, geometries):
         layers = self.getLayersToCut()
         if len(layers) == 0:
             QMessageBox.warning(None,'No source layers', 'Select source layers in the settings')
-            return
+            return False
 
         t_layer_idx = self.getTargetLayer()
         if t_layer_idx == 0:
             QMessageBox.warning(None,'Missing target layer', 'Select the target layer in the settings')
-            return
-
-        source_geom = QgsGeometry(self.geometryClass.geometry)
-
-        if source_geom.isGeosValid() == False:
-            source_geom = geom.makeValid()
-
-        if source_geom.isGeosValid() == False:
-            QMessageBox.warning(None,'Geometry error', 'The source geometry is incorrect')
-            return
-
-        dest_geom = []
-
-        for layer in layers:
-            if not layer.isEditable():
-                    layer.startEditing()
+            return False
 
-            geom = QgsGeometry(source_geom)
+        source_geoms = []
+        for geometry in geometries:
+            source_geom = QgsGeometry(geometry)
 
-            for f in layer.getFeatures(geom.boundingBox()):
-                f_geom = f.geometry()
-                
-                if f_geom.intersects(geom):
+            if source_geom.isGeosValid() == False:
+                source_geom = source_geom.makeValid()
 
-                    dest_geom.append(f_geom.intersection(geom))
+            if source_geom.isGeosValid() == False:
+                QMessageBox.warning(None,'Geometry error', 'The source geometry is incorrect')
+                return False
 
-                    f_geom = f_geom.difference(geom)
-                    att = f.attributes()
+            source_geoms.append(source_geom)
 
-                    for part in f_geom.parts():
-                        part_wkt = part.asWkt()
-                        part_geom = QgsGeometry.fromWkt(part_wkt)
-                        
-                        new_feature = QgsFeature()
-                        new_feature.setGeometry(part_geom)
-                        new_feature.setAttributes(att)
-                        layer.addFeature(new_feature)   
+        if self.cutTask is not None:
+            QMessageBox.warning(None,'Cut in progress', 'Wait until the previous cut is finished')
+            return False
 
-                    layer.deleteFeature(f.id())
+        target_layer = self.polygonLayers[t_layer_idx - 1 ][0]
 
-        if len(dest_geom) > 0:
-            target_geom = QgsGeometry().unaryUnion(dest_geom)
-            target_layer = self.polygonLayers[t_layer_idx - 1 ][0]
+        # Geometry is computed in the background, edits come back to the main thread
+        canvas_crs = self.canvas.mapSettings().destinationCrs()
+        self.cutTask = CutTask(source_geoms, canvas_crs, layers, target_layer, [l[0] for l in self.polygonLayers], indexCache())
+        self.cutTask.cutFinished.connect(self.cutFinished)
+        self.cutTask.cutFailed.connect(self.cutFailed)
+        self.cutTask.taskCompleted.connect(self.cutTaskDone)
+        self.cutTask.taskTerminated.connect(self.cutTaskDone)
+        QgsApplication.taskManager().addTask(self.cutTask)
+        return True
 
-            for part in target_geom.parts():
-                part_wkt = part.asWkt()
-                part_geom = QgsGeometry.fromWkt(part_wkt)
-                self.addTopologicalPointsForActiveLayers(part_geom)
+    def cutFailed(self, message):
+        self.iface.messageBar().pushWarning('Cut elements', message)
 
-                feature = QgsFeature(target_layer.fields())
-                feature.setGeometry(part_geom)
-                target_layer.addFeature(feature)  
+    def cutFinished(self, scanned, modified):
+        QgsMessageLog.logMessage('Cut: scanned {} candidates, modified {} features'.format(scanned, modified), 'Geofabryka Toolbox', Qgis.Info)
+        if self.queuedCut:
+            self.tool.clearQueue()
+        self.tool.preview.invalidate()
+        self.canvas.refresh()
 
-    def addTopologicalPointsForActiveLayers(self, geometry):
-        geometry = QgsGeometry(geometry)
-        layers = self.polygonLayers
+    def cutTaskDone(self):
+        self.cutTask = None
+        self.queuedCut = False
 
-        for l in layers:
-            layer = l[0]
-            if not layer.isEditable():
-                layer.startEditing()
-
-            topology = QgsVectorLayerEditUtils(layer)
-            vertices = [v for v in geometry.vertices()]
-
-            for v in vertices:
-                point = v.asWkt()
-                point = QgsGeometry.fromWkt(point)
-                point = point.asPoint()
-                topology.addTopologicalPoints(point)  
-        return True
+    def queueChanged(self):
+        self.settingsWidget.applyButton.setEnabled(len(self.geometryClass.pending) > 0)
 
     def clickShowAll(self):
         for i in range(0, len(self.polygonLayers)):
@@ -205,14 +214,6 @@ class Cutter:
             item = self.settingsWidget.listWidget.item(i)
             item.setCheckState(0)
 
-    def geometryCrs2Crs(self,geometry, source_crs, destination_crs):
-        geometry = QgsGeometry(geometry)
-        src_crs = QgsCoordinateReferenceSystem(source_crs)
-        dest_crs = QgsCoordinateReferenceSystem(destination_crs)
-        crs2crs = QgsCoordinateTransform(src_crs, dest_crs, QgsProject.instance())
-        geometry.transform(crs2crs)
-        return geometry
-
     def getLayersToCut(self):
         layers = []
         for i in range(0, len(self.polygonLayers)):
@@ -302,6 +303,14 @@ class Cutter:
                 if layer.geometryType() == 2: # 2 = Polygon layer
                     self.polygonLayers.append([layer,layer.id()])
                     
+    def sourceLayersChanged(self):
+        self.tool.preview.invalidate()
+
+    def streamSettingsChanged(self):
+        self.tool.streamMode = self.settingsWidget.checkBox_stream.isChecked()
+        self.tool.streamTolerance = self.settingsWidget.spinBox_streamTolerance.value()
+        self.tool.streamInterval = self.settingsWidget.spinBox_streamInterval.value()
+
     def tr(self, message):
         return QCoreApplication.translate('Cutter', message)
 
@@ -309,9 +318,13 @@ class Cutter_geometry():
     geometry = None
     geoemtry_crs = None
 
+    def __init__(self):
+        self.pending = []
+
 class addPolygon(QgsMapTool):
     cut = pyqtSignal()
     deact = pyqtSignal()
+    queued = pyqtSignal()
     def __init__(self, iface, action, geometryClass):
         self.canvas = iface.mapCanvas()
         self.iface = iface
@@ -334,6 +347,24 @@ class addPolygon(QgsMapTool):
         self.rubberBand_click.setWidth(0)
         self.rubberBand_click.setFillColor(obj_color_alpha)
 
+        # queued cut areas waiting for 'Apply queued cuts'
+        pending_color = QColor(254,150,0)
+        pending_color_alpha = QColor(254,150,0)
+        pending_color_alpha.setAlpha(60)
+        self.rubberBand_pending = QgsRubberBand(self.canvas,QgsWkbTypes.GeometryType(3))
+        self.rubberBand_pending.setWidth(1)
+        self.rubberBand_pending.setStrokeColor(pending_color)
+        self.rubberBand_pending.setFillColor(pending_color_alpha)
+        self.queueMode = False
+        self.preview = None
+
+        # stream digitizing: a vertex every streamTolerance pixels or streamInterval ms
+        self.streamMode = False
+        self.streamTolerance = 10
+        self.streamInterval = 0
+        self.streamTimer = QElapsedTimer()
+        self.lastVertexPos = None
+
         # snap marker
         self.snap_mark = QgsVertexMarker(self.canvas)
         self.snap_mark.setColor(vert_color)
@@ -342,71 +373,114 @@ class addPolygon(QgsMapTool):
         self.snap_mark.setIconSize(10)
 
         self.points = []
+        self.snapping = snappingService(self.canvas)
+        self.snapLayers = None
 
     def activate(self):
         self.action.setChecked(True)
         self.setCursor(Qt.CrossCursor)
+        self.snapping.reset()
+        if self.snapLayers is not None:
+            self.snapping.prepare(self.snapLayers())
+
+    def addVertex(self, point):
+        # Rubber bands are updated in place, the last rubber band vertex follows the cursor
+        self.points.append(point)
+        self.rubberBand_click.addPoint(point)
+        self.rubberBand_click.show()
+
+        if len(self.points) == 1:
+            self.rubberBand.addPoint(point)
+        else:
+            self.rubberBand.movePoint(point)
+        self.rubberBand.addPoint(point)
 
-    def canvasMoveEvent( self, e ):
-        self.snap_mark.hide()
-        self.snapPoint = False
-        self.snapPoint = self.checkSnapToPoint(e.pos())
+        self.lastVertexPos = self.toCanvasCoordinates(point)
+        self.streamTimer.start()
 
-        if self.snapPoint[0]:
-            self.snap_mark.setCenter(self.snapPoint[1])
-            self.snap_mark.show()
+    def canvasMoveEvent( self, e ):
+        self.showSnap(self.checkSnapToPoint(e.pos()))
 
         if len(self.points) > 0:
-            self.rubberBand.reset(QgsWkbTypes.GeometryType(3))
-            point = self.toMapCoordinates(self.canvas.mouseLastXY())   
-            temp_points = self.points[:]
-            temp_points.append(point)
-            polygon = QgsGeometry.fromPolygonXY([temp_points])
-            self.rubberBand.setToGeometry(polygon,None)
+            point = self.toMapCoordinates(e.pos())
+
+            if self.streamMode and self.streamThresholdReached(e.pos()):
+                self.addVertex(point)
+            else:
+                self.rubberBand.movePoint(point)
             self.rubberBand.show()
 
+            if self.preview.enabled:
+                self.preview.update(self.points, point)
+
     def canvasPressEvent (self, e):
         # Left mouse button
         if e.button() == Qt.LeftButton:
+            self.snapPoint = self.checkSnapToPoint(e.pos(), True)
             if self.snapPoint[0]:
                 point = self.snapPoint[1]
             else:
                 point = self.toMapCoordinates(self.canvas.mouseLastXY())
 
-            self.points.append(point)
-            polygon = QgsGeometry.fromPolygonXY([self.points])
-            self.rubberBand_click.reset(QgsWkbTypes.GeometryType(3))
-            self.rubberBand_click.setToGeometry(polygon,None)
-            self.rubberBand_click.show()
+            self.addVertex(point)
 
         # Right mouse button
         if e.button() == Qt.RightButton:
+            if len(self.points) < 3:
+                self.reset()
+                return
+
             geometry = QgsGeometry.fromPolygonXY([self.points])
-            self.geometryClass.geometry = geometry
-            self.cut.emit()
+            if self.queueMode:
+                self.geometryClass.pending.append(geometry)
+                self.rubberBand_pending.addGeometry(geometry, None)
+                self.rubberBand_pending.show()
+                self.queued.emit()
+            else:
+                self.geometryClass.geometry = geometry
+                self.cut.emit()
             self.reset()
 
-    def checkSnapToPoint(self, point):
-        snapped = False
-        snap_point = self.toMapCoordinates(point)
-        snapper = self.canvas.snappingUtils()
-        snapMatch = snapper.snapToMap(point)
-        if snapMatch.hasVertex():
-            snap_point = snapMatch.point()
-            snapped = True
-        return snapped, snap_point
+    def checkSnapToPoint(self, point, force=False):
+        return self.snapping.snap(point, force, self.showSnap)
+
+    def clearQueue(self):
+        self.geometryClass.pending = []
+        self.rubberBand_pending.reset(QgsWkbTypes.GeometryType(3))
+        self.queued.emit()
 
     def deactivate(self):
         self.action.setChecked(False)
+        self.snapping.reset()
         self.reset()
+        self.clearQueue()
         self.deact.emit()
 
     def keyPressEvent (self,e):
         if e.key() == Qt.Key_Escape:
+            # The first Escape drops the polygon being drawn, the next one the queued polygons
+            if len(self.points) == 0:
+                self.clearQueue()
             self.reset()
 
+    def showSnap(self, snapPoint):
+        self.snapPoint = snapPoint
+        self.snap_mark.hide()
+        if self.snapPoint[0]:
+            self.snap_mark.setCenter(self.snapPoint[1])
+            self.snap_mark.show()
+
+    def streamThresholdReached(self, pos):
+        distance = math.hypot(pos.x() - self.lastVertexPos.x(), pos.y() - self.lastVertexPos.y())
+        if distance < 1:
+            return False
+        if distance >= self.streamTolerance:
+            return True
+        return self.streamInterval > 0 and self.streamTimer.elapsed() >= self.streamInterval
+
     def reset(self):
         self.rubberBand_click.reset(QgsWkbTypes.GeometryType(3))
         self.rubberBand.reset(QgsWkbTypes.GeometryType(3))
         self.snap_mark.hide()
+        self.preview.clear()
         self.points = []
@@ -0,0 +1,134 @@
+# -*- coding: utf-8 -*-
+
+# ***************************************************************************
+#   This program is free software; you can redistribute it and/or modify    *
+#   it under the terms of the GNU General Public License as published by    *
+#   the Free Software Foundation; either version 2 of the License, or       *
+#   (at your option) any later version.                                     *
+# ***************************************************************************
+#     begin                : 2019-09-17                                     *
+#     copyright            : (C) 2019 by Adrian Bocianowski                 *
+#     email                : adrian at bocianowski.com.pl                   *
+# ***************************************************************************
+
+from qgis.core import QgsGeometry, QgsPolygon, QgsCurvePolygon
+
+from .geometryParts import geometryParts, exteriorRing
+from .layerIndex import indexCache
+from .obstacles import obstacleCandidates, obstacleMask
+from .topology import pointRectangle
+from .transforms import transformGeometry, transformPoint
+
+# Search area doublings of an expanding fill, the last search is 256 times wider
+MAX_EXPANSIONS = 8
+
+def pointInPolygons(point, crs, layers):
+    # Only the features around the point are tested, the rest of the search area is not fetched
+    for layer in layers:
+        layer_point = transformPoint(point, crs, layer.crs())
+        point_geom = QgsGeometry.fromPointXY(layer_point)
+        index = indexCache().index(layer)
+        for fid in index.intersects(pointRectangle(layer_point)):
+            if index.geometry(fid).intersects(point_geom):
+                return True
+    return False
+
+def freeSpace(search_geom, crs, layers, indexes=None):
+    # Search area minus the cascaded union of the overlapping polygons, in one difference
+    mask = obstacleMask(search_geom, crs, layers, indexes)
+    if mask is None:
+        return QgsGeometry(search_geom)
+    return search_geom.difference(mask)
+
+def partAt(geometry, point_geom):
+    for part_geom in geometryParts(geometry):
+        if part_geom.intersects(point_geom):
+            return part_geom
+    return None
+
+def fillAt(point, crs, polygon_layers, network, radius, expand=False):
+    # Empty space around the point, the same for a Painter click and a seed point; None when there is none.
+    # When expanding, the search starts at the radius and doubles while the space is cut by the search circle.
+    point_geom = QgsGeometry.fromPointXY(point)
+    if len(polygon_layers) > 0:
+        if pointInPolygons(point, crs, polygon_layers):
+            return None
+
+        # A hole of a restrictive polygon is closed already, no search circle is needed
+        hole_geom = holeAt(point, crs, polygon_layers)
+        if hole_geom is not None:
+            return fillHole(point_geom, crs, polygon_layers, network, hole_geom)
+
+    expansions = MAX_EXPANSIONS if expand else 0
+    for i in range(expansions + 1):
+        circle_geom = point_geom.buffer(radius, 20)
+        # Wider circles use the coarser levels of the network, kept between clicks
+        search_network = network.level(radius) if network is not None else None
+        target_geom = fillWithin(point_geom, crs, polygon_layers, search_network, circle_geom)
+        if target_geom == None or not touchesBorder(target_geom, circle_geom):
+            break
+        radius *= 2
+    return target_geom
+
+def fillHole(point_geom, crs, polygon_layers, network, hole_geom):
+    # The hole is the fill as it is, only the features overlapping it are subtracted
+    target_geom = hole_geom
+    engine, candidates = obstacleCandidates(hole_geom, crs, polygon_layers)
+    if len(candidates) > 0:
+        target_geom = partAt(hole_geom.difference(QgsGeometry.unaryUnion(candidates)), point_geom)
+
+    # Line faces are only needed when a restrictive line crosses the hole
+    if target_geom != None and network is not None:
+        engine, lines = obstacleCandidates(target_geom, crs, network.layers, network.indexes)
+        if len(lines) > 0:
+            # A large hole is searched on a coarser level, like an expanded search
+            bbox = target_geom.boundingBox()
+            target_geom = network.level(max(bbox.width(), bbox.height()) / 2).faceAt(point_geom, target_geom)
+    return target_geom
+
+def fillWithin(point_geom, crs, polygon_layers, network, search_geom):
+    target_geom = None
+
+    if len(polygon_layers) > 0:
+        search_geom = freeSpace(search_geom, crs, polygon_layers)
+        target_geom = partAt(search_geom, point_geom)
+
+    if network is not None:
+        face_geom = network.faceAt(point_geom, search_geom)
+        if face_geom != None:
+            if target_geom == None:
+                target_geom = face_geom
+            else:
+                target_geom = target_geom.intersection(face_geom)
+
+    if target_geom == None:
+        return None
+
+    target_geom.convertGeometryCollectionToSubclass(2)
+    return partAt(target_geom, point_geom)
+
+def holeAt(point, crs, layers):
+    # Interior ring around the point of a polygon found through the layer index, in crs
+    for layer in layers:
+        layer_point = transformPoint(point, crs, layer.crs())
+        point_geom = QgsGeometry.fromPointXY(layer_point)
+        index = indexCache().index(layer)
+
+        for fid in index.intersects(pointRectangle(layer_point)):
+            for part in index.geometry(fid).constParts():
+                if not isinstance(part, QgsCurvePolygon):
+                    continue
+                for i in range(part.numInteriorRings()):
+                    ring = part.interiorRing(i)
+                    if not ring.boundingBox().contains(layer_point):
+                        continue
+                    polygon = QgsPolygon()
+                    polygon.setExteriorRing(ring.clone())
+                    hole_geom = QgsGeometry(polygon)
+                    if hole_geom.contains(point_geom):
+                        return transformGeometry(hole_geom, layer.crs(), crs)
+    return None
+
+def touchesBorder(geometry, circle_geom):
+    # Shares a piece of the search circle, so the space may continue outside it
+    return geometry.intersection(exteriorRing(circle_geom)).length() > 0
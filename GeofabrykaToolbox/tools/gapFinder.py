@@ -0,0 +1,103 @@
+# -*- coding: utf-8 -*-
+
+# ***************************************************************************
+#   This program is free software; you can redistribute it and/or modify    *
+#   it under the terms of the GNU General Public License as published by    *
+#   the Free Software Foundation; either version 2 of the License, or       *
+#   (at your option) any later version.                                     *
+# ***************************************************************************
+#     begin                : 2019-09-17                                     *
+#     copyright            : (C) 2019 by Adrian Bocianowski                 *
+#     email                : adrian at bocianowski.com.pl                   *
+# ***************************************************************************
+
+from qgis.core import QgsGeometry, QgsSpatialIndex, QgsWkbTypes
+
+from .fillEngine import freeSpace
+from .geometryParts import geometryParts, exteriorRing
+from .lineNetwork import LineNetwork
+
+# Tiles of one search, the extent or the tile size has to be changed above it
+MAX_TILES = 10000
+
+class GapFinder:
+    def __init__(self, polygon_layers, line_layers, crs, tile_size, indexes=None):
+        self.polygonLayers = polygon_layers
+        self.crs = crs
+        self.indexes = indexes
+        self.network = LineNetwork(line_layers, crs, tile_size, indexes)
+
+    def find(self, extent, feedback=None):
+        # Empty spaces enclosed by the restrictive layers inside the extent, largest first
+        gaps = []
+        open_pieces = []
+        count = self.network.tileCount(extent)
+        total = 100.0 / count if count else 0
+
+        for current, key in enumerate(self.network.tileKeys(extent)):
+            if feedback is not None and feedback.isCanceled():
+                break
+
+            rect = self.network.tileRect(key).intersect(extent)
+            if rect.isEmpty():
+                continue
+            tile_geom = QgsGeometry.fromRect(rect)
+            border = exteriorRing(tile_geom)
+            free = freeSpace(tile_geom, self.crs, self.polygonLayers, self.indexes)
+
+            index, faces, dangles = self.network.tile(key)
+            for i in index.intersects(rect):
+                for piece in geometryParts(faces[i].intersection(free)):
+                    if piece.type() != QgsWkbTypes.PolygonGeometry or piece.area() == 0:
+                        continue
+                    # Pieces cut by the tile border are completed with the neighbouring tiles
+                    if piece.intersection(border).length() > 0:
+                        open_pieces.append((key, piece))
+                    else:
+                        gaps.append(piece)
+
+            # Tiles are not needed again, only the open pieces are kept between them
+            self.network.releaseTile(key)
+            if feedback is not None:
+                feedback.setProgress(int((current + 1) * total))
+
+        gaps += self.mergeOpenPieces(open_pieces, extent)
+        self.network.release()
+        gaps.sort(key=lambda g: g.area(), reverse=True)
+        return gaps
+
+    def mergeOpenPieces(self, pieces, extent):
+        index = QgsSpatialIndex()
+        for i, (key, piece) in enumerate(pieces):
+            index.addFeature(i, piece.boundingBox())
+
+        extent_border = exteriorRing(QgsGeometry.fromRect(extent))
+        merged = []
+        done = set()
+
+        for i in range(len(pieces)):
+            if i in done:
+                continue
+            group = [i]
+            queue = [i]
+            done.add(i)
+
+            while len(queue) > 0:
+                current = queue.pop()
+                key, piece = pieces[current]
+                for other in index.intersects(piece.boundingBox()):
+                    # Pieces of the same tile are split by a restrictive line or polygon
+                    if other in done or pieces[other][0] == key:
+                        continue
+                    if piece.intersection(pieces[other][1]).length() > 0:
+                        done.add(other)
+                        group.append(other)
+                        queue.append(other)
+
+            geometry = QgsGeometry.unaryUnion([pieces[g][1] for g in group])
+            # Space open to the extent border is not enclosed
+            if geometry.intersection(extent_border).length() > 0:
+                continue
+            merged.append(geometry)
+
+        return merged
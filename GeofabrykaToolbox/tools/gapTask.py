@@ -0,0 +1,96 @@
+# -*- coding: utf-8 -*-
+
+# ***************************************************************************
+#   This program is free software; you can redistribute it and/or modify    *
+#   it under the terms of the GNU General Public License as published by    *
+#   the Free Software Foundation; either version 2 of the License, or       *
+#   (at your option) any later version.                                     *
+# ***************************************************************************
+#     begin                : 2019-09-17                                     *
+#     copyright            : (C) 2019 by Adrian Bocianowski                 *
+#     email                : adrian at bocianowski.com.pl                   *
+# ***************************************************************************
+
+from PyQt5.QtCore import pyqtSignal
+
+from qgis.core import QgsTask, QgsFeedback, QgsVectorLayerFeatureSource
+
+from .gapFinder import GapFinder
+from .layerIndex import buildIndex
+from .layerTask import LayerTask
+from .transforms import transformCache
+
+class GapTask(LayerTask):
+    gapsFound = pyqtSignal(list)
+    gapsFailed = pyqtSignal(str)
+
+    def __init__(self, polygon_layers, line_layers, crs, tile_size, extent, cache):
+        QgsTask.__init__(self, 'Find gaps', QgsTask.CanCancel)
+        self.polygonLayers = polygon_layers
+        self.lineLayers = line_layers
+        self.layers = polygon_layers + line_layers
+        self.crs = crs
+        self.tileSize = tile_size
+        self.extent = extent
+        self.cache = cache
+        self.indexes = {}
+        self.sources = {}
+        self.builtIndexes = {}
+        self.gaps = None
+
+        self.indexFeedback = QgsFeedback()
+        self.feedback = QgsFeedback()
+        self.feedback.progressChanged.connect(self.setProgress)
+
+        for layer in self.layers:
+            # Missing indexes are built in the task from a thread safe copy of the layer
+            if cache.hasIndex(layer):
+                self.indexes[layer.id()] = cache.indexes[layer.id()]
+            else:
+                self.sources[layer.id()] = QgsVectorLayerFeatureSource(layer)
+
+            # Transforms come from the cache in the main thread, the task only applies them
+            if not transformCache().isSame(layer.crs(), crs):
+                transformCache().transform(layer.crs(), crs)
+                transformCache().transform(crs, layer.crs())
+        self.watchLayers(self.layers)
+
+    def cancel(self):
+        self.indexFeedback.cancel()
+        self.feedback.cancel()
+        QgsTask.cancel(self)
+
+    def finished(self, result):
+        # Called in the main thread, the dialog only sees complete results
+        self.disconnectLayers()
+
+        if not result or self.gaps is None:
+            self.gapsFailed.emit('The search was canceled')
+            return
+
+        if len(self.modifiedLayers) > 0:
+            self.gapsFailed.emit('Restrictive layers were edited while gaps were searched, repeat the search')
+            return
+
+        for layer in self.layers:
+            if layer.id() in self.builtIndexes:
+                self.cache.adopt(layer, self.builtIndexes[layer.id()])
+
+        self.gapsFound.emit(self.gaps)
+
+    def run(self):
+        for layer_id, source in self.sources.items():
+            self.builtIndexes[layer_id] = buildIndex(source, self.indexFeedback)
+            if self.isCanceled():
+                return False
+
+        indexes = dict(self.indexes)
+        indexes.update(self.builtIndexes)
+
+        finder = GapFinder(self.polygonLayers, self.lineLayers, self.crs, self.tileSize, indexes)
+        gaps = finder.find(self.extent, self.feedback)
+        if self.isCanceled():
+            return False
+
+        self.gaps = gaps
+        return True
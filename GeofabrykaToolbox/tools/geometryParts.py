@@ -0,0 +1,50 @@
+# -*- coding: utf-8 -*-
+
+# ***************************************************************************
+#   This program is free software; you can redistribute it and/or modify    *
+#   it under the terms of the GNU General Public License as published by    *
+#   the Free Software Foundation; either version 2 of the License, or       *
+#   (at your option) any later version.                                     *
+# ***************************************************************************
+#     begin                : 2019-09-17                                     *
+#     copyright            : (C) 2019 by Adrian Bocianowski                 *
+#     email                : adrian at bocianowski.com.pl                   *
+# ***************************************************************************
+
+# Geometry helpers working on clones of the abstract geometry,
+# without the asWkt()/fromWkt() text round-trip.
+
+from qgis.core import QgsGeometry, QgsLineString, QgsPoint, QgsCurvePolygon
+
+def geometryParts(geometry):
+    if geometry is None or geometry.isNull():
+        return []
+    return [QgsGeometry(part.clone()) for part in geometry.constParts()]
+
+def ringLinestring(ring):
+    if isinstance(ring, QgsLineString):
+        return QgsGeometry(ring.clone())
+    return QgsGeometry(ring.curveToLine())
+
+def exteriorRing(geometry):
+    for part in geometry.constParts():
+        if isinstance(part, QgsCurvePolygon) and part.exteriorRing() is not None:
+            return ringLinestring(part.exteriorRing())
+    return None
+
+def geometryRings(geometry):
+    rings = []
+    if geometry is None or geometry.isNull():
+        return rings
+
+    for part in geometry.constParts():
+        if not isinstance(part, QgsCurvePolygon) or part.exteriorRing() is None:
+            continue
+        rings.append(ringLinestring(part.exteriorRing()))
+        for i in range(part.numInteriorRings()):
+            rings.append(ringLinestring(part.interiorRing(i)))
+    return rings
+
+def vertexPoints(geometry):
+    # 2D copies of the vertices, read straight from the abstract geometry
+    return [QgsPoint(v.x(), v.y()) for v in geometry.vertices()]
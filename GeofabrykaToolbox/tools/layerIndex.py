@@ -0,0 +1,157 @@
+# -*- coding: utf-8 -*-
+
+# ***************************************************************************
+#   This program is free software; you can redistribute it and/or modify    *
+#   it under the terms of the GNU General Public License as published by    *
+#   the Free Software Foundation; either version 2 of the License, or       *
+#   (at your option) any later version.                                     *
+# ***************************************************************************
+#     begin                : 2019-09-17                                     *
+#     copyright            : (C) 2019 by Adrian Bocianowski                 *
+#     email                : adrian at bocianowski.com.pl                   *
+# ***************************************************************************
+
+from qgis.core import QgsProject, QgsSpatialIndex, QgsFeature, QgsFeatureRequest
+
+_indexCache = None
+
+def indexCache():
+    # One cache shared by all tools, so an index built by one tool is reused by the others
+    global _indexCache
+    if _indexCache is None:
+        _indexCache = LayerIndexCache()
+    return _indexCache
+
+def buildIndex(source, feedback=None):
+    # Works with layers and thread safe feature sources alike
+    request = QgsFeatureRequest().setNoAttributes()
+    return QgsSpatialIndex(source.getFeatures(request), feedback, QgsSpatialIndex.FlagStoreFeatureGeometries)
+
+def layerIndex(layer, indexes=None):
+    # Indexes handed over to a background task, the shared cache otherwise
+    if indexes is not None:
+        return indexes[layer.id()]
+    return indexCache().index(layer)
+
+class LayerIndexCache:
+    def __init__(self):
+        self.indexes = {}
+        self.layers = {}
+        self.pendingIds = {}
+        self.connections = {}
+        QgsProject.instance().layersWillBeRemoved.connect(self.layersWillBeRemoved)
+
+    def adopt(self, layer, index):
+        # Index built elsewhere (e.g. in a background task) from the current layer state
+        if not self.hasIndex(layer):
+            self.indexes[layer.id()] = index
+            if layer.id() not in self.layers:
+                self.layers[layer.id()] = layer
+                self.connectLayer(layer)
+
+    def buildIndex(self, layer, feedback=None):
+        return buildIndex(layer, feedback)
+
+    def connect(self, layer, signal, slot):
+        signal.connect(slot)
+        self.connections.setdefault(layer.id(), []).append((signal, slot))
+
+    def connectLayer(self, layer):
+        self.connect(layer, layer.featureAdded, lambda fid, l=layer: self.featureAdded(l, fid))
+        self.connect(layer, layer.featureDeleted, lambda fid, l=layer: self.featureDeleted(l, fid))
+        self.connect(layer, layer.geometryChanged, lambda fid, geom, l=layer: self.geometryChanged(l, fid, geom))
+        # Commit renumbers added features, rollback restores the provider state
+        self.connect(layer, layer.beforeCommitChanges, lambda *args, l=layer: self.beforeCommitChanges(l))
+        self.connect(layer, layer.committedFeaturesAdded, lambda layer_id, features, l=layer: self.committedFeaturesAdded(l, features))
+        self.connect(layer, layer.afterCommitChanges, lambda l=layer: self.afterCommitChanges(l))
+        self.connect(layer, layer.afterRollBack, lambda l=layer: self.invalidate(l))
+        self.connect(layer, layer.dataSourceChanged, lambda l=layer: self.invalidate(l))
+
+    def disconnectLayer(self, layer_id):
+        for signal, slot in self.connections.pop(layer_id, []):
+            try:
+                signal.disconnect(slot)
+            except (TypeError, RuntimeError):
+                pass
+
+    def afterCommitChanges(self, layer):
+        temporary_ids = self.pendingIds.pop(layer.id(), [])
+        if layer.id() not in self.indexes:
+            return
+
+        edit_buffer = layer.editBuffer()
+        if edit_buffer is not None and len(edit_buffer.addedFeatures()) > 0:
+            # Failed commit, the edit buffer still holds the temporary features
+            self.invalidate(layer)
+            return
+
+        for fid in temporary_ids:
+            self.featureDeleted(layer, fid)
+
+    def beforeCommitChanges(self, layer):
+        edit_buffer = layer.editBuffer()
+        if edit_buffer is not None:
+            self.pendingIds[layer.id()] = list(edit_buffer.addedFeatures().keys())
+
+    def committedFeaturesAdded(self, layer, features):
+        index = self.indexes.get(layer.id())
+        if index is None:
+            return
+        for feature in features:
+            if feature.hasGeometry():
+                index.addFeature(feature)
+
+    def featureAdded(self, layer, fid):
+        index = self.indexes.get(layer.id())
+        if index is None:
+            return
+        feature = layer.getFeature(fid)
+        if feature.hasGeometry():
+            index.addFeature(feature)
+
+    def featureDeleted(self, layer, fid):
+        index = self.indexes.get(layer.id())
+        if index is None:
+            return
+        geometry = index.geometry(fid)
+        if not geometry.isNull():
+            feature = QgsFeature(fid)
+            feature.setGeometry(geometry)
+            index.deleteFeature(feature)
+
+    def geometryChanged(self, layer, fid, geometry):
+        index = self.indexes.get(layer.id())
+        if index is None:
+            return
+        self.featureDeleted(layer, fid)
+        feature = QgsFeature(fid)
+        feature.setGeometry(geometry)
+        index.addFeature(feature)
+
+    def hasIndex(self, layer):
+        return layer.id() in self.indexes
+
+    def index(self, layer):
+        layer_id = layer.id()
+        if layer_id not in self.indexes:
+            self.indexes[layer_id] = self.buildIndex(layer)
+            if layer_id not in self.layers:
+                self.layers[layer_id] = layer
+                self.connectLayer(layer)
+        return self.indexes[layer_id]
+
+    def invalidate(self, layer):
+        self.indexes.pop(layer.id(), None)
+
+    def release(self, layer):
+        self.indexes.pop(layer.id(), None)
+        self.pendingIds.pop(layer.id(), None)
+        self.layers.pop(layer.id(), None)
+        self.disconnectLayer(layer.id())
+
+    def layersWillBeRemoved(self, layer_ids):
+        for layer_id in layer_ids:
+            self.indexes.pop(layer_id, None)
+            self.pendingIds.pop(layer_id, None)
+            self.layers.pop(layer_id, None)
+            self.disconnectLayer(layer_id)
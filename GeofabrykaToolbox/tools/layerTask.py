@@ -0,0 +1,34 @@
+# -*- coding: utf-8 -*-
+
+# ***************************************************************************
+#   This program is free software; you can redistribute it and/or modify    *
+#   it under the terms of the GNU General Public License as published by    *
+#   the Free Software Foundation; either version 2 of the License, or       *
+#   (at your option) any later version.                                     *
+# ***************************************************************************
+#     begin                : 2019-09-17                                     *
+#     copyright            : (C) 2019 by Adrian Bocianowski                 *
+#     email                : adrian at bocianowski.com.pl                   *
+# ***************************************************************************
+
+from qgis.core import QgsTask
+
+class LayerTask(QgsTask):
+    # Background task computed from layers, its result is dropped when one of them is edited meanwhile
+    def watchLayers(self, layers):
+        self.watchedLayers = list(layers)
+        self.modifiedLayers = set()
+        for layer in self.watchedLayers:
+            layer.layerModified.connect(self.layerModified)
+
+    def disconnectLayers(self):
+        for layer in self.watchedLayers:
+            try:
+                layer.layerModified.disconnect(self.layerModified)
+            except (TypeError, RuntimeError):
+                pass
+
+    def layerModified(self):
+        layer = self.sender()
+        if layer is not None:
+            self.modifiedLayers.add(layer.id())
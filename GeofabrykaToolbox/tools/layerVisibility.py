@@ -0,0 +1,86 @@
+# -*- coding: utf-8 -*-
+
+# ***************************************************************************
+#   This program is free software; you can redistribute it and/or modify    *
+#   it under the terms of the GNU General Public License as published by    *
+#   the Free Software Foundation; either version 2 of the License, or       *
+#   (at your option) any later version.                                     *
+# ***************************************************************************
+#     begin                : 2019-09-17                                     *
+#     copyright            : (C) 2019 by Adrian Bocianowski                 *
+#     email                : adrian at bocianowski.com.pl                   *
+# ***************************************************************************
+
+from qgis.core import QgsProject, QgsLayerTree, QgsMapLayer, QgsWkbTypes
+
+_layerVisibility = None
+
+def layerVisibility():
+    global _layerVisibility
+    if _layerVisibility is None:
+        _layerVisibility = LayerVisibilityCache()
+    return _layerVisibility
+
+class LayerVisibilityCache:
+    def __init__(self):
+        # Polygon layers of the project and the visible ones, kept up to date from the layer tree signals
+        self.dirty = True
+        self.polygons = []
+        self.ordered = []
+        self.visible = []
+        self.visibleIds = set()
+
+        project = QgsProject.instance()
+        root = project.layerTreeRoot()
+        root.visibilityChanged.connect(self.visibilityChanged)
+        # Moving a node can hide it inside an unchecked group
+        root.addedChildren.connect(self.invalidate)
+        root.removedChildren.connect(self.invalidate)
+        root.layerOrderChanged.connect(self.invalidate)
+        project.layersAdded.connect(self.invalidate)
+        project.layersRemoved.connect(self.invalidate)
+        project.cleared.connect(self.invalidate)
+
+    def invalidate(self, *args):
+        self.dirty = True
+
+    def polygonLayers(self):
+        if self.dirty:
+            self.rebuild()
+        return self.polygons
+
+    def rebuild(self):
+        project = QgsProject.instance()
+        self.polygons = []
+        for layer in project.mapLayers().values():
+            if layer.type() == QgsMapLayer.VectorLayer and layer.geometryType() == QgsWkbTypes.PolygonGeometry:
+                self.polygons.append(layer)
+
+        # Visible layers are kept in the drawing order, top layer first
+        root = project.layerTreeRoot()
+        polygon_ids = set(l.id() for l in self.polygons)
+        self.ordered = [l for l in root.layerOrder() if l.id() in polygon_ids]
+        self.visibleIds = set(node.layerId() for node in root.findLayers() if node.isVisible())
+        self.updateVisible()
+        self.dirty = False
+
+    def updateVisible(self):
+        self.visible = [l for l in self.ordered if l.id() in self.visibleIds]
+
+    def visibilityChanged(self, node):
+        if self.dirty:
+            return
+
+        # A group change affects every layer below it
+        nodes = [node] if QgsLayerTree.isLayer(node) else node.findLayers()
+        for layer_node in nodes:
+            if layer_node.isVisible():
+                self.visibleIds.add(layer_node.layerId())
+            else:
+                self.visibleIds.discard(layer_node.layerId())
+        self.updateVisible()
+
+    def visibleLayers(self):
+        if self.dirty:
+            self.rebuild()
+        return self.visible
@@ -0,0 +1,249 @@
+# -*- coding: utf-8 -*-
+
+# ***************************************************************************
+#   This program is free software; you can redistribute it and/or modify    *
+#   it under the terms of the GNU General Public License as published by    *
+#   the Free Software Foundation; either version 2 of the License, or       *
+#   (at your option) any later version.                                     *
+# ***************************************************************************
+#     begin                : 2019-09-17                                     *
+#     copyright            : (C) 2019 by Adrian Bocianowski                 *
+#     email                : adrian at bocianowski.com.pl                   *
+# ***************************************************************************
+
+import math
+
+from qgis.core import QgsGeometry, QgsFeature, QgsRectangle, QgsSpatialIndex
+
+from .geometryParts import geometryParts, geometryRings, exteriorRing
+from .layerIndex import layerIndex
+from .topology import pointRectangle
+from .transforms import transformCache, transformGeometry, transformRect
+
+# Tile size in search radius units, a search circle then covers at most four tiles
+TILE_FACTOR = 4
+
+def tileCount(rect, tile_size):
+    columns = int(math.floor(rect.xMaximum() / tile_size)) - int(math.floor(rect.xMinimum() / tile_size)) + 1
+    rows = int(math.floor(rect.yMaximum() / tile_size)) - int(math.floor(rect.yMinimum() / tile_size)) + 1
+    return columns * rows
+
+class LineNetwork:
+    def __init__(self, layers, crs, tile_size, indexes=None):
+        # Faces of the noded line layers, polygonized once per tile and kept in the given CRS
+        self.layers = list(layers)
+        self.crs = crs
+        self.tileSize = tile_size
+        self.indexes = indexes
+        self.tiles = {}
+        self.featureTiles = {}
+        self.connections = []
+        self.levels = {}
+
+        # Given indexes are a snapshot for a background task, edits are not followed
+        if self.indexes is None:
+            for layer in self.layers:
+                self.connectLayer(layer)
+
+    def buildTile(self, key):
+        rect = self.tileRect(key)
+        lines = []
+
+        for layer in self.layers:
+            index = layerIndex(layer, self.indexes)
+            for fid in index.intersects(transformRect(rect, self.crs, layer.crs())):
+                line = transformGeometry(index.geometry(fid), layer.crs(), self.crs).clipped(rect)
+                if line.isEmpty():
+                    continue
+                lines.append(line)
+                self.featureTiles.setdefault((layer.id(), fid), set()).add(key)
+
+        # The tile border closes the faces cut by the tile
+        border = exteriorRing(QgsGeometry.fromRect(rect))
+        noded = QgsGeometry.unaryUnion(lines + [border])
+        faces = geometryParts(QgsGeometry.polygonize(geometryParts(noded)))
+
+        index = QgsSpatialIndex(QgsSpatialIndex.FlagStoreFeatureGeometries)
+        for i, face in enumerate(faces):
+            feature = QgsFeature(i)
+            feature.setGeometry(face)
+            index.addFeature(feature)
+
+        # Edges inside a face are dangles, polygonize drops them. Edges reaching the tile border may be
+        # dangles of the whole network, their faces are joined with the neighbouring tiles. Both are kept
+        # apart, as they bound a fill once a search boundary cuts them
+        border_engine = QgsGeometry.createGeometryEngine(border.constGet())
+        border_engine.prepareGeometry()
+        dangles = QgsSpatialIndex(QgsSpatialIndex.FlagStoreFeatureGeometries)
+        for i, edge in enumerate(geometryParts(noded)):
+            if border_engine.contains(edge.constGet()):
+                continue
+            loose = border_engine.intersects(edge.constGet())
+            if not loose:
+                middle = edge.interpolate(edge.length() / 2)
+                loose = any(faces[f].contains(middle) for f in index.intersects(pointRectangle(middle.asPoint())))
+            if loose:
+                feature = QgsFeature(i)
+                feature.setGeometry(edge)
+                dangles.addFeature(feature)
+
+        self.tiles[key] = (index, faces, dangles)
+        return self.tiles[key]
+
+    def clear(self, *args):
+        self.tiles = {}
+        self.featureTiles = {}
+
+    def connect(self, signal, slot):
+        signal.connect(slot)
+        self.connections.append((signal, slot))
+
+    def connectLayer(self, layer):
+        self.connect(layer.featureAdded, lambda fid, l=layer: self.featureChanged(l, fid, l.getFeature(fid).geometry()))
+        self.connect(layer.featureDeleted, lambda fid, l=layer: self.featureChanged(l, fid, None))
+        self.connect(layer.geometryChanged, lambda fid, geom, l=layer: self.featureChanged(l, fid, geom))
+        # Commit renumbers features, rollback and a new data source replace them
+        self.connect(layer.afterCommitChanges, self.clear)
+        self.connect(layer.afterRollBack, self.clear)
+        self.connect(layer.dataSourceChanged, self.clear)
+
+    def faceAt(self, point_geom, search_geom):
+        # Face of the line network around the point, limited to the search geometry
+        point = point_geom.asPoint()
+        start_key = self.tileKey(point.x(), point.y())
+        index, faces, dangles = self.tile(start_key)
+
+        start = None
+        for i in index.intersects(pointRectangle(point)):
+            if faces[i].intersects(point_geom):
+                start = (start_key, i)
+                break
+        if start is None:
+            return None
+
+        search_engine = QgsGeometry.createGeometryEngine(search_geom.constGet())
+        search_engine.prepareGeometry()
+
+        candidates = {}
+        for key in self.tileKeys(search_geom.boundingBox()):
+            index, faces, dangles = self.tile(key)
+            for i in index.intersects(search_geom.boundingBox()):
+                if search_engine.intersects(faces[i].constGet()):
+                    candidates[(key, i)] = faces[i]
+        candidates[start] = self.tiles[start_key][1][start[1]]
+
+        keys = list(candidates.keys())
+        candidate_index = QgsSpatialIndex()
+        for i, key in enumerate(keys):
+            candidate_index.addFeature(i, candidates[key].boundingBox())
+
+        # Faces of neighbouring tiles are joined where they share a piece of the tile border
+        region = set([start])
+        queue = [start]
+        while len(queue) > 0:
+            current = queue.pop()
+            for i in candidate_index.intersects(candidates[current].boundingBox()):
+                other = keys[i]
+                if other in region or other[0] == current[0]:
+                    continue
+                if candidates[current].intersection(candidates[other]).length() > 0:
+                    region.add(other)
+                    queue.append(other)
+
+        region_geom = QgsGeometry.unaryUnion([candidates[r] for r in region]).intersection(search_geom)
+        return self.splitRegion(region_geom, search_geom, set(r[0] for r in region), point_geom)
+
+    def featureChanged(self, layer, fid, geometry):
+        keys = self.featureTiles.pop((layer.id(), fid), set())
+        if geometry is not None and not geometry.isNull():
+            keys = keys | set(self.tileKeys(transformRect(geometry.boundingBox(), layer.crs(), self.crs)))
+        for key in keys:
+            self.tiles.pop(key, None)
+
+    def isFor(self, layers, crs, tile_size):
+        return [l.id() for l in layers] == [l.id() for l in self.layers] and transformCache().crsKey(crs) == transformCache().crsKey(self.crs) and tile_size == self.tileSize
+
+    def level(self, radius):
+        # Network whose tiles are at least the search diameter, so a search covers four tiles at most.
+        # Coarser levels double the tile size and are kept for the following searches
+        tile_size = self.tileSize
+        while tile_size < 2 * radius:
+            tile_size *= 2
+        if tile_size == self.tileSize:
+            return self
+        if tile_size not in self.levels:
+            self.levels[tile_size] = LineNetwork(self.layers, self.crs, tile_size, self.indexes)
+        return self.levels[tile_size]
+
+    def release(self):
+        for signal, slot in self.connections:
+            try:
+                signal.disconnect(slot)
+            except (TypeError, RuntimeError):
+                pass
+        self.connections = []
+        for network in self.levels.values():
+            network.release()
+        self.levels = {}
+        self.clear()
+
+    def releaseTile(self, key):
+        self.tiles.pop(key, None)
+
+    def splitRegion(self, region_geom, search_geom, keys, point_geom):
+        # A dangle inside the region reaching the search boundary may close a face with it. Only then
+        # is the region noded again, with those dangles; otherwise the joined faces are the answer
+        if region_geom.isEmpty():
+            return None
+
+        region_engine = QgsGeometry.createGeometryEngine(region_geom.constGet())
+        region_engine.prepareGeometry()
+        boundary_geom = QgsGeometry.collectGeometry(geometryRings(search_geom))
+        engine = QgsGeometry.createGeometryEngine(boundary_geom.constGet())
+        engine.prepareGeometry()
+
+        bbox = region_geom.boundingBox()
+        lines = []
+        split = False
+        for key in keys:
+            dangles = self.tiles[key][2]
+            for fid in dangles.intersects(bbox):
+                line = dangles.geometry(fid)
+                # Edges on the region boundary bound it already
+                if not region_engine.intersects(line.constGet()) or region_engine.touches(line.constGet()):
+                    continue
+                lines.append(line)
+                if not split and engine.intersects(line.constGet()):
+                    split = True
+
+        if split:
+            pieces = [line.intersection(region_geom) for line in lines]
+            pieces = [piece for piece in pieces if piece.length() > 0]
+            region_geom = QgsGeometry.polygonize(geometryParts(QgsGeometry.unaryUnion(geometryRings(region_geom) + pieces)))
+
+        for part_geom in geometryParts(region_geom):
+            if part_geom.intersects(point_geom):
+                return part_geom
+        return None
+
+    def tile(self, key):
+        if key not in self.tiles:
+            return self.buildTile(key)
+        return self.tiles[key]
+
+    def tileKey(self, x, y):
+        return (int(math.floor(x / self.tileSize)), int(math.floor(y / self.tileSize)))
+
+    def tileCount(self, rect):
+        return tileCount(rect, self.tileSize)
+
+    def tileKeys(self, rect):
+        # Generated one by one, a large extent does not build the whole key list
+        x_min, y_min = self.tileKey(rect.xMinimum(), rect.yMinimum())
+        x_max, y_max = self.tileKey(rect.xMaximum(), rect.yMaximum())
+        for x in range(x_min, x_max + 1):
+            for y in range(y_min, y_max + 1):
+                yield (x, y)
+
+    def tileRect(self, key):
+        return QgsRectangle(key[0] * self.tileSize, key[1] * self.tileSize, (key[0] + 1) * self.tileSize, (key[1] + 1) * self.tileSize)
@@ -0,0 +1,74 @@
+# -*- coding: utf-8 -*-
+
+# ***************************************************************************
+#   This program is free software; you can redistribute it and/or modify    *
+#   it under the terms of the GNU General Public License as published by    *
+#   the Free Software Foundation; either version 2 of the License, or       *
+#   (at your option) any later version.                                     *
+# ***************************************************************************
+#     begin                : 2019-09-17                                     *
+#     copyright            : (C) 2019 by Adrian Bocianowski                 *
+#     email                : adrian at bocianowski.com.pl                   *
+# ***************************************************************************
+
+from PyQt5.QtCore import QElapsedTimer
+
+from qgis.core import Qgis, QgsGeometry, QgsMessageLog
+
+from .layerIndex import layerIndex
+from .transforms import transformGeometry, transformRect
+
+def obstacleCandidates(geometry, crs, layers, indexes=None):
+    # Obstacles overlapping the geometry, from all layers, in the geometry CRS
+    geometry = QgsGeometry(geometry)
+    engine = QgsGeometry.createGeometryEngine(geometry.constGet())
+    engine.prepareGeometry()
+    candidates = []
+
+    for layer in layers:
+        bbox = transformRect(geometry.boundingBox(), crs, layer.crs())
+        index = layerIndex(layer, indexes)
+
+        for fid in index.intersects(bbox):
+            f_geom = transformGeometry(index.geometry(fid), layer.crs(), crs)
+
+            # Features only touching the geometry do not change the difference
+            if not engine.intersects(f_geom.constGet()) or engine.touches(f_geom.constGet()):
+                continue
+
+            if f_geom.isGeosValid() == False:
+                f_geom = f_geom.makeValid()
+
+            if f_geom.isGeosValid() == True:
+                candidates.append(f_geom)
+
+    return engine, candidates
+
+def obstacleMask(geometry, crs, layers, indexes=None):
+    # Union of the obstacles overlapping the geometry, None when there are none
+    engine, candidates = obstacleCandidates(geometry, crs, layers, indexes)
+    if len(candidates) == 0:
+        return None
+    return QgsGeometry.unaryUnion(candidates)
+
+def clipByObstacles(geometry, crs, layers, log=True):
+    timer = QElapsedTimer()
+    timer.start()
+
+    engine, candidates = obstacleCandidates(geometry, crs, layers)
+    fetch_time = timer.restart()
+
+    if len(candidates) == 0:
+        return QgsGeometry(geometry)
+
+    # Cascaded union of all obstacles, then a single difference
+    obstacles = QgsGeometry.unaryUnion(candidates)
+    union_time = timer.restart()
+
+    result = QgsGeometry(engine.difference(obstacles.constGet()))
+    difference_time = timer.elapsed()
+
+    if log:
+        QgsMessageLog.logMessage('Obstacle clipping: {} obstacles, fetch {} ms, union {} ms, difference {} ms'.format(
+            len(candidates), fetch_time, union_time, difference_time), 'Geofabryka Toolbox', Qgis.Info)
+    return result
@@ -12,8 +12,18 @@
 # ***************************************************************************
 
 import os
+from collections import OrderedDict
 from ..resources import *
 from ..dialogs.buffer_settingsPanel import settingsPanel
+from .arcLength import ArcLengthTable
+from .obstacles import clipByObstacles, obstacleMask
+from .geometryParts import geometryParts
+from .ringIndex import RingIndex
+from .topology import addTopologicalPoints, pointRectangle
+from .layerIndex import indexCache
+from .snapping import snappingService
+from .layerVisibility import layerVisibility
+from .transforms import transformGeometry, transformPoint
 
 from PyQt5 import QtWidgets
 from PyQt5.QtCore import QSettings, QCoreApplication, Qt, pyqtSignal
@@ -21,7 +31,13 @@ from PyQt5.QtGui import QIcon, QColor, QCursor
 from PyQt5.QtWidgets import QMenu, QAction, QToolTip
 
 from qgis.gui import  QgsMapToolIdentify, QgsRubberBand, QgsVertexMarker
-from qgis.core import QgsProject, QgsFeature, QgsGeometry, QgsWkbTypes, QgsVectorLayerEditUtils, QgsPolygon, QgsVectorLayerUtils
+from qgis.core import QgsFeatureRequest, QgsGeometry, QgsWkbTypes, QgsPolygon, QgsVectorLayerUtils
+
+# Buffer quality while dragging and number of cached preview buffers
+PREVIEW_SEGMENTS = 4
+PREVIEW_CACHE_SIZE = 64
+# Initial obstacle mask corridor, in tolerance steps
+MASK_STEPS = 50
 
 class OneSideBuffer:
     def __init__(self, iface, plugin_dir, toolbar, icon_path):
@@ -148,14 +164,25 @@ class OneSideBuffer_tool(QgsMapToolIdentify):
 
         self.firstPoint_locate = None
         self.linestring = None
+        self.arcTable = None
+        self.ringIndex = None
+        self.side = 1
+        self.substringId = 0
+        self.previewCache = OrderedDict()
+        self.mask = None
+        self.maskWidth = 0
 
         self.dist = self.spinbox.value()
+        self.snapping = snappingService(self.canvas)
 
-        self.canvas.layersChanged.connect(self.setPolygonLayers)
+        self.visibility = layerVisibility()
+        self.polygonLayers = []
 
     def activate(self):
         self.setCursor(Qt.CrossCursor)
         self.setPolygonLayers()
+        self.snapping.reset()
+        self.snapping.prepare(self.getVisibleLayers())
 
     def addMenu(self):
         menu = QMenu()
@@ -166,17 +193,10 @@ class OneSideBuffer_tool(QgsMapToolIdentify):
         menu.exec_(QCursor.pos())
 
     def addFeature(self, dest_layer):
-        geometry_canvas = self.geom_poly
-
-        for l in self.getVisibleLayers():
-            geometry_canvas = self.getDifferenceGeometry(geometry_canvas, l)
+        geometry_canvas = self.getDifferenceGeometry(self.geom_poly, self.getVisibleLayers())
 
         # dump geom if it s multipart
-        geometry_parts = [p for p in geometry_canvas.parts()]
-        for part in geometry_parts:
-            part_wkt = part.asWkt()
-            part_geom = QgsGeometry.fromWkt(part_wkt)
-
+        for part_geom in geometryParts(geometry_canvas):
             if part_geom.isGeosValid() == False:
                 part_geom = part_geom.makeValid()
 
@@ -184,7 +204,7 @@ class OneSideBuffer_tool(QgsMapToolIdentify):
                 self.addTopologicalPointsForActiveLayers(part_geom)
 
                 feature = QgsVectorLayerUtils.createFeature(dest_layer)
-                feature.setGeometry(part_geom)
+                feature.setGeometry(transformGeometry(part_geom, self.canvasCrs(), dest_layer.crs()))
 
                 height_col_idx = dest_layer.fields().indexFromName('SZEROKOSC')
 
@@ -199,21 +219,7 @@ class OneSideBuffer_tool(QgsMapToolIdentify):
                 self.iface.openFeatureForm(dest_layer, feature, False)
 
     def addTopologicalPointsForActiveLayers(self, geometry):
-        geometry = QgsGeometry(geometry)
-        layers = self.getVisibleLayers()
-        for layer in layers:
-            if not layer.isEditable():
-                layer.startEditing()
-
-            topology = QgsVectorLayerEditUtils(layer)
-            vertices = [v for v in geometry.vertices()]
-
-            for v in vertices:
-                point = v.asWkt()
-                point = QgsGeometry.fromWkt(point)
-                point = point.asPoint()
-                topology.addTopologicalPoints(point)  
-            
+        addTopologicalPoints(geometry, self.getVisibleLayers(), self.canvasCrs())
         return True
     
     def calculateSide(self , linestring, point):
@@ -225,56 +231,41 @@ class OneSideBuffer_tool(QgsMapToolIdentify):
      
     def canvasMoveEvent(self, e ):
         if self.firstPointMode == True or self.secondPointMode == True:
-            self.snapPoint = self.checkSnapToPoint(e.pos())
-
-            if self.snapPoint[0]:
-                self.snap_mark.setCenter(self.snapPoint[1])
-                self.snap_mark.show()
-                self.point = QgsGeometry.fromPointXY (self.snapPoint[1])
-            else:
-                self.snap_mark.hide()
-                self.point = QgsGeometry.fromPointXY (self.toMapCoordinates(e.pos()))
-
-        if self.secondPointMode:
-            self.secondPoint_locate = self.linestring.lineLocatePoint(self.point)
-            self.output_geom = self.lineSubstring(self.linestring,self.firstPoint_locate,self.secondPoint_locate)
-
-            if self.output_geom != None:
-                self.rubberBand.setToGeometry(self.output_geom, None)
-                self.rubberBand.show()
+            self.showSnap(self.checkSnapToPoint(e.pos()))
 
         if self.objectSizeMode:
             s_point = QgsGeometry.fromPointXY (self.toMapCoordinates(e.pos()))
 
             #if round(abs(self.output_geom.distance(s_point) - self.dist),1) >= self.spinbox.value():
             #self.dist = round(self.output_geom.distance(s_point)/self.spinbox.value(),1)
-            self.dist = int(self.output_geom.distance(s_point)/self.spinbox.value())
-            self.dist = self.dist * self.spinbox.value()
+            step = int(self.output_geom.distance(s_point)/self.spinbox.value())
+            self.dist = step * self.spinbox.value()
             QToolTip.showText( self.canvas.mapToGlobal( self.canvas.mouseLastXY() ), str(round(self.dist,2)), self.canvas )
 
-            left_or_right = self.calculateSide(self.output_geom, s_point)
-            self.geom_poly = self.output_geom.singleSidedBuffer(self.dist,20,left_or_right,2)
+            self.side = self.calculateSide(self.output_geom, s_point)
+            self.geom_poly = self.previewBuffer(step, self.side)
             self.rubberBand.setToGeometry(self.geom_poly, None)
             self.rubberBand.show()
 
     def canvasPressEvent (self, e):
         if e.button() == Qt.LeftButton:
-            layerType = getattr(QgsMapToolIdentify,'VectorLayer')
-            results = self.identify(e.x(), e.y(), self.TopDownStopAtFirst ,layerType)
-
             if self.selectFeatureMode:
-                if len(results) == 0 or results[0].mLayer not in [l for l in self.polygonLayers]:
+                self.setPolygonLayers()
+                layer, feature = self.identifyPolygon(e.pos())
+                if layer is None:
                     for l in self.polygonLayers:
                         l.removeSelection()
 
-                elif len(results) > 0:
+                else:
                     for l in self.polygonLayers:
                         try:
                             l.removeSelection()
                         except:
                             pass
-                    self.current_layer = self.cur_lyr = results[0].mLayer
-                    self.current_feature = QgsFeature(results[0].mFeature)
+                    self.current_layer = self.cur_lyr = layer
+                    self.current_feature = feature
+                    self.current_geometry = transformGeometry(self.current_feature.geometry(), self.current_layer.crs(), self.canvasCrs())
+                    self.ringIndex = RingIndex(self.current_geometry)
                     self.current_layer.select(self.current_feature.id())
                     self.iface.setActiveLayer(self.current_layer)
 
@@ -282,143 +273,127 @@ class OneSideBuffer_tool(QgsMapToolIdentify):
                     self.firstPointMode = True
 
             elif self.firstPointMode:
-                self.linestring = self.polygon2Linestring(self.current_feature.geometry(), e.pos())
+                # The throttled move may lag behind the cursor, the clicked point is always snapped anew
+                self.showSnap(self.checkSnapToPoint(e.pos(), True))
+                self.linestring = self.polygon2Linestring(self.current_geometry, e.pos())
                 self.firstPoint_locate = self.linestring.lineLocatePoint(self.point)
                 self.firstPointMode = False
                 self.secondPointMode = True
 
             elif self.secondPointMode:
+                self.showSnap(self.checkSnapToPoint(e.pos(), True))
                 self.secondPointMode = False
                 self.objectSizeMode = True
                 self.dist = self.spinbox.value()
+                self.substringId += 1
+                self.mask = None
+                self.maskWidth = 0
 
             elif self.objectSizeMode:
                 self.objectSizeMode = False
+                # The side and width come from the click itself, not from the last preview frame
+                s_point = QgsGeometry.fromPointXY (self.toMapCoordinates(e.pos()))
+                self.dist = int(self.output_geom.distance(s_point)/self.spinbox.value()) * self.spinbox.value()
+                self.side = self.calculateSide(self.output_geom, s_point)
+                # Full quality buffer only for the committed geometry
+                self.geom_poly = self.output_geom.singleSidedBuffer(self.dist,20,self.side,2)
                 self.addMenu()
                 self.reset()
 
-    def checkSnapToPoint(self, point):
-        snapped = False
-        snap_point = self.toMapCoordinates(point)
-        snapper = self.canvas.snappingUtils()
-        snapMatch = snapper.snapToMap(point)
-        if snapMatch.hasVertex():
-            snap_point = snapMatch.point()
-            snapped = True
-        return snapped, snap_point
+    def buildObstacleMask(self, width):
+        # Obstacles in a corridor around the fixed substring, subtracted from every preview frame
+        corridor = self.output_geom.buffer(width, PREVIEW_SEGMENTS)
+        self.mask = obstacleMask(corridor, self.canvasCrs(), self.getVisibleLayers())
+        self.maskWidth = width
+
+    def canvasCrs(self):
+        return self.canvas.mapSettings().destinationCrs()
+
+    def checkSnapToPoint(self, point, force=False):
+        return self.snapping.snap(point, force, self.showSnap)
+
+    def clipPreview(self, geometry, dist):
+        if dist > self.maskWidth:
+            self.buildObstacleMask(max(dist * 2, self.spinbox.value() * MASK_STEPS))
+        if self.mask is None:
+            return geometry
+        return geometry.difference(self.mask)
 
     def deactivate(self):
         self.action.setChecked(False)
+        self.snapping.reset()
         self.rubberBand.hide()
         self.deact.emit()
 
-    def getDifferenceGeometry(self, geometry, layer):
-        geometry = QgsGeometry(geometry)
-        bbox = geometry.boundingBox()
-
-        for f in layer.getFeatures(bbox):
-            f_geom = f.geometry()
-
-            if f_geom.isGeosValid() == False:
-                f_geom = f_geom.makeValid()
-
-            if f_geom.isGeosValid() == True: 
-                if geometry.intersects(f_geom):
-                    geometry = geometry.difference(f_geom)
-
-        return geometry
+    def getDifferenceGeometry(self, geometry, layers):
+        return clipByObstacles(geometry, self.canvasCrs(), layers)
 
     def getVisibleLayers(self):
-        array = []
-        root = QgsProject.instance().layerTreeRoot()
-        for l in self.polygonLayers:
-            node = root.findLayer(l.id())
-            if node:
-                visible = node.isVisible ()
-                if visible:
-                    array.append(l)
-        return array
+        return self.visibility.visibleLayers()
+
+    def identifyPolygon(self, pos):
+        # Top-down point in polygon test over the visible polygon layers only
+        point = self.toMapCoordinates(pos)
+        for layer in self.getVisibleLayers():
+            if layer.hasScaleBasedVisibility() and not layer.isInScaleRange(self.canvas.scale()):
+                continue
+
+            layer_point = transformPoint(point, self.canvasCrs(), layer.crs())
+            rect = pointRectangle(layer_point)
+            if indexCache().hasIndex(layer):
+                index = indexCache().index(layer)
+                for fid in index.intersects(rect):
+                    if index.geometry(fid).contains(layer_point):
+                        return layer, layer.getFeature(fid)
+            else:
+                # A click must not download the whole layer to build its index, ask the provider instead
+                for feature in layer.getFeatures(QgsFeatureRequest().setFilterRect(rect)):
+                    if feature.geometry().contains(layer_point):
+                        return layer, feature
+        return None, None
 
     def keyPressEvent (self,e):
         if e.key() == Qt.Key_Escape:
             self.reset()
 
-    def lineSubstring(self, linestring, start, end):
-        array = [linestring.lineLocatePoint(QgsGeometry.fromWkt(i.asWkt())) for i in linestring.vertices()]
-        one_array = []
-        second_array = []
-        # 1 Geom
-        if start < end:
-            one_array.append(start)
-            for i in array:
-                if i > start and i < end:
-                    one_array.append(i)
-            one_array.append(end)
-        else:
-            one_array.append(start)
-            for i in array:
-                if i > start:
-                    one_array.append(i)
-            one_array.append(0.0)
-            for i in array:
-                if i < end and i > 0:
-                    one_array.append(i)
-            one_array.append(end)
-
-        # 2 Geom
-        if start < end:
-            second_array.append(end)
-            for i in array:
-                if i > end:
-                    second_array.append(i)
-            second_array.append(0.0)
-            for i in array:
-                if i < start and i > 0:
-                    second_array.append(i)
-            second_array.append(start)
-        else:
-            second_array.append(end)
-            for i in array:
-                if i > end and i < start:
-                    second_array.append(i)
-            second_array.append(start)
-
-        one_geom = QgsGeometry.fromPolylineXY([linestring.interpolate(i).asPoint() for i in one_array])
-        second_geom = QgsGeometry.fromPolylineXY([linestring.interpolate(i).asPoint() for i in second_array])
-
-        if second_geom.length() < one_geom.length():
+    def lineSubstring(self, start, end):
+        # Both directions come from the arc-length table built in polygon2Linestring
+        if self.arcTable.forwardLength(end, start) < self.arcTable.forwardLength(start, end):
             self.linestring_rev = True
-            return (second_geom)
+            return self.arcTable.substring(end, start)
         else:
             self.linestring_rev = False
-            return(one_geom)
+            return self.arcTable.substring(start, end)
 
     def point2LayerCoordinate(self, pos, layer):
-        layer_crs = layer.crs().authid()
-        canvas_crs = self.canvas.mapSettings().destinationCrs().authid()
-
         point = self.toMapCoordinates(pos)
         point = QgsGeometry.fromPointXY(point)
-        point = self.geometryCrs2Crs(point, canvas_crs, layer_crs)
-        return point
+        return transformGeometry(point, self.canvasCrs(), layer.crs())
 
     def polygon2Linestring(self, poly_geom, pos):
-        geom_parts = [p for p in poly_geom.parts()]
-        pos_geom = QgsGeometry.fromPointXY (self.toMapCoordinates(pos))
-
-        cur_dist = None
-        cur_geom = None
-        for p in geom_parts:
-            p_geom = QgsGeometry.fromWkt(p.asWkt())
-            p_geom = QgsGeometry.fromPolyline([p for p in p_geom.vertices()])
-            p_geom_dist = p_geom.distance(pos_geom)
+        if self.ringIndex is None:
+            self.ringIndex = RingIndex(poly_geom)
 
-            if cur_dist == None or p_geom_dist < cur_dist:
-                cur_geom = p_geom
-                cur_dist = p_geom_dist
+        cur_geom = self.ringIndex.nearest(self.toMapCoordinates(pos))
 
+        if cur_geom != None:
+            self.arcTable = ArcLengthTable(cur_geom)
         return cur_geom
 
+    def previewBuffer(self, step, side):
+        # Distance is snapped to tolerance steps, so most moves hit the cache
+        key = (step, side, self.substringId, self.spinbox.value())
+        if key in self.previewCache:
+            self.previewCache.move_to_end(key)
+            return self.previewCache[key]
+
+        geometry = self.output_geom.singleSidedBuffer(step * self.spinbox.value(), PREVIEW_SEGMENTS, side, 2)
+        geometry = self.clipPreview(geometry, step * self.spinbox.value())
+        self.previewCache[key] = geometry
+        if len(self.previewCache) > PREVIEW_CACHE_SIZE:
+            self.previewCache.popitem(last=False)
+        return geometry
+
     def reset(self):
         self.current_layer.removeSelection()
         self.selectFeatureMode = True
@@ -426,15 +401,31 @@ class OneSideBuffer_tool(QgsMapToolIdentify):
         self.secondPointMode = False
         self.firstPoint_locate = None
         self.linestring = None
+        self.ringIndex = None
         self.objectSizeMode = False
         self.snap_mark.hide()
         self.rubberBand.hide()
         self.dist = self.spinbox.value()
+        self.previewCache.clear()
+        self.mask = None
+        self.maskWidth = 0
 
     def setPolygonLayers(self):
-        self.polygonLayers = []
-        for l in QgsProject.instance().mapLayers():
-            layer = QgsProject.instance().mapLayer(l)
-            if  layer.type() == 0: # 0 = Vector layer
-                if layer.geometryType() == 2: # 2 = Polygon layer
-                    self.polygonLayers.append(layer)
+        self.polygonLayers = self.visibility.polygonLayers()
+
+    def showSnap(self, snapPoint):
+        self.snapPoint = snapPoint
+        if self.snapPoint[0]:
+            self.snap_mark.setCenter(self.snapPoint[1])
+            self.snap_mark.show()
+        else:
+            self.snap_mark.hide()
+        self.point = QgsGeometry.fromPointXY(self.snapPoint[1])
+
+        if self.secondPointMode:
+            self.secondPoint_locate = self.linestring.lineLocatePoint(self.point)
+            self.output_geom = self.lineSubstring(self.firstPoint_locate,self.secondPoint_locate)
+
+            if self.output_geom != None:
+                self.rubberBand.setToGeometry(self.output_geom, None)
+                self.rubberBand.show()
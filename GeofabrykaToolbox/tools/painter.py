@@ -14,13 +14,22 @@
 import os
 from ..resources import *
 from ..dialogs.painter_settingsPanel import settingsPanel
+from ..dialogs.painter_gaps import GapsDialog
+from .topology import addTopologicalPoints
+from .fillEngine import fillAt
+from .gapFinder import MAX_TILES
+from .gapTask import GapTask
+from .layerIndex import indexCache
+from .lineNetwork import LineNetwork, TILE_FACTOR, tileCount
+from .snapping import snappingService
+from .transforms import transformGeometry, transformRect
 
 from PyQt5.QtCore import QSettings, QCoreApplication, Qt, pyqtSignal
 from PyQt5.QtGui import QIcon, QColor, QCursor
-from PyQt5.QtWidgets import  QToolButton, QMenu, QAction, QListWidgetItem, QMessageBox
+from PyQt5.QtWidgets import  QToolButton, QMenu, QAction, QListWidgetItem, QMessageBox, QTableWidgetItem
 
 from qgis.gui import QgsMapTool, QgsVertexMarker, QgsRubberBand
-from qgis.core import QgsWkbTypes, QgsGeometry, QgsProject, QgsFeature, QgsVectorLayerEditUtils, QgsVectorLayerUtils
+from qgis.core import QgsApplication, QgsWkbTypes, QgsProject, QgsFeature, QgsVectorLayerUtils, QgsRectangle
 
 class Painter:
     def __init__(self, iface, plugin_dir, toolbar, icon_path):
@@ -49,12 +58,14 @@ class Painter:
                 QCoreApplication.installTranslator(self.translator)
 
         self.actions = []
+        self.network = None
 
         self.geometry_class = Painters_geometry()
 
         self.tool = addPolygon(self.iface, None, self.geometry_class)
         self.tool.pos.connect(self.clickTool)
         self.tool.res.connect(self.reset)
+        self.tool.snapLayers = lambda: [l[0] for l in self.layers]
         
         self.settingsWidget = settingsPanel()
         self.settingsWidget.checkBox_allLayers.stateChanged.connect(self.clickAllLayers)
@@ -71,8 +82,20 @@ class Painter:
         self.settingsWidget.hideButton.clicked.connect(self.clickHideAll)
         self.settingsWidget.checkBoxPolygon.stateChanged.connect(self.rebuildListWidget)
         self.settingsWidget.checkBoxLine.stateChanged.connect(self.rebuildListWidget)
+        self.settingsWidget.pushButton_findGaps.clicked.connect(self.clickFindGaps)
         self.settingsWidget.hide()
 
+        self.gaps = []
+        self.filledGaps = set()
+        self.gapsTask = None
+        self.gapsDialog = GapsDialog(self.iface.mainWindow())
+        self.gapsDialog.pushButton_find.clicked.connect(self.clickFind)
+        self.gapsDialog.pushButton_fillSelected.clicked.connect(self.clickFillSelected)
+        self.gapsDialog.pushButton_fillAll.clicked.connect(self.clickFillAll)
+        self.gapsDialog.tableWidget.itemSelectionChanged.connect(self.showSelectedGaps)
+        self.gapsDialog.tableWidget.cellDoubleClicked.connect(self.clickGap)
+        self.gapsDialog.closingDialog.connect(self.closeGapsDialog)
+
         icon = QIcon(self.icon_path + 'selectAll.svg')
         self.settingsWidget.showButton.setIcon(icon)
 
@@ -144,7 +167,7 @@ class Painter:
 
     def addFeature(self, layer):
         feature = QgsVectorLayerUtils.createFeature(layer)
-        feature.setGeometry(self.target_geom)
+        feature.setGeometry(transformGeometry(self.target_geom, self.canvasCrs(), layer.crs()))
         layer.addFeature(feature)
         self.addTopologicalPoints(self.target_geom)
         self.canvas.refresh()
@@ -161,22 +184,28 @@ class Painter:
         self.reset()
 
     def addTopologicalPoints(self, geometry):
-        geometry = QgsGeometry(geometry)
-        layers = self.getLayers(2)
-
-        for l in layers:
-            layer = l[0]
-            if not layer.isEditable():
-                layer.startEditing()
+        layers = self.getLayers(2) or []
+        addTopologicalPoints(geometry, [l[0] for l in layers], self.canvasCrs())
 
-            topology = QgsVectorLayerEditUtils(layer)
-            vertices = [v for v in geometry.vertices()]
+    def canvasCrs(self):
+        return self.canvas.mapSettings().destinationCrs()
 
-            for v in vertices:
-                point = v.asWkt()
-                point = QgsGeometry.fromWkt(point)
-                point = point.asPoint()
-                topology.addTopologicalPoints(point)  
+    def chooseTargetLayer(self):
+        if self.settingsWidget.checkBox_askTargetLayer.isChecked():
+            menu = QMenu()
+            for i in self.layers:
+                if i[2] == 2:
+                    action = menu.addAction(i[0].name())
+                    action.setData(i[1])
+            action = menu.exec_(QCursor.pos())
+            if action is not None:
+                return self.qgsProject.mapLayer(action.data())
+            return None
+
+        t_layer = self.getTargetLayer()
+        if t_layer == None:
+            QMessageBox.warning(None,'Missing target layer', 'Select one of the settings')
+        return t_layer
 
     def clickAllLayers(self):
         if self.settingsWidget.checkBox_allLayers.isChecked():
@@ -219,6 +248,42 @@ class Painter:
             except AttributeError:
                 break
 
+    def clickFillAll(self):
+        indices = [i for i in range(len(self.gaps)) if i not in self.filledGaps]
+        if len(indices) == 0:
+            return
+
+        t_layer = self.chooseTargetLayer()
+        if t_layer != None:
+            self.fillGaps(indices, t_layer, False)
+
+    def clickFillSelected(self):
+        indices = self.selectedGaps()
+        if len(indices) == 0:
+            return
+
+        t_layer = self.chooseTargetLayer()
+        if t_layer != None:
+            # A single gap is filled like a click, with the feature form
+            self.fillGaps(indices, t_layer, len(indices) == 1)
+
+    def clickFind(self):
+        if self.gapsTask is not None:
+            self.gapsTask.cancel()
+        else:
+            self.findGaps()
+
+    def clickFindGaps(self):
+        self.gapsDialog.show()
+        self.gapsDialog.raise_()
+
+    def clickGap(self, row, column):
+        gap = self.gaps[self.gapsDialog.tableWidget.item(row, 0).data(Qt.DisplayRole) - 1]
+        extent = gap.boundingBox()
+        extent.scale(1.5)
+        self.canvas.setExtent(extent)
+        self.canvas.refresh()
+
     def clickHideAll(self):
         for i in range(0, 10000):
             try:
@@ -229,82 +294,25 @@ class Painter:
             
     def clickTool(self):
         self.rubberBand.reset(QgsWkbTypes.GeometryType(3))
-        click_point_geom = QgsGeometry.fromPointXY(self.geometry_class.geometry)
-        buffer_geom = click_point_geom.buffer(self.settingsWidget.spinBox_searchArea.value(),20)
+        polygon_layers, line_layers = self.restrictiveLayers()
 
-        lines_layers = self.getLayers(1)
-        polygons_layers = self.getLayers(2)
-        len_line_layers = 0
-        len_polygon_layers = 0
+        if len(polygon_layers) == 0 and len(line_layers) == 0:
+            QMessageBox.warning(None,'Missing restrictive layers', 'Select one of the settings')
+            return
 
-        try:
-            len_line_layers += len(lines_layers)
-        except TypeError:
-            pass
+        network = None
+        if len(line_layers) > 0:
+            network = self.lineNetwork(line_layers)
 
-        try:
-            len_polygon_layers += len(polygons_layers)
-        except TypeError:
-            pass
+        self.target_geom = fillAt(self.geometry_class.geometry, self.canvasCrs(), polygon_layers, network, self.settingsWidget.spinBox_searchArea.value(), self.settingsWidget.checkBox_expandSearch.isChecked())
 
-        if len_polygon_layers == 0 and len_line_layers == 0:
-            QMessageBox.warning(None,'Missing restrictive layers', 'Select one of the settings')
+        if self.target_geom == None:
+            QMessageBox.warning(None,'No space to fill', 'No space to fill, choose a different location')
             return
 
-        self.target_geom = None
-
-        # Polygon layers
-        if self.settingsWidget.checkBoxPolygon.isChecked() and len_polygon_layers > 0:
-            for l in polygons_layers:
-                poly_layer = l[0]
-                
-                for f in poly_layer.getFeatures(buffer_geom.boundingBox()):
-                    f_geom = f.geometry()
-                    if f_geom.intersects(click_point_geom):
-                        QMessageBox.warning(None,'No space to fill', 'No space to fill, choose a different location')
-                        return
-                        
-                    if f_geom.intersects(buffer_geom):
-                        buffer_geom = buffer_geom.difference(f_geom)
-
-                if not poly_layer.isEditable():
-                    poly_layer.startEditing()
-                
-                for part in buffer_geom.parts():
-                    part_wkt = part.asWkt()
-                    part_geom = QgsGeometry.fromWkt(part_wkt)
-                    if part_geom.intersects(click_point_geom):
-                        target_geom = part_geom
-                        break 
-
-        # Line layers
-        if self.settingsWidget.checkBoxLine.isChecked():
-            for l in lines_layers:
-                line_layer = l[0]
-                features = [i.geometry() for i in line_layer.getFeatures(buffer_geom.boundingBox())]
-                buffer_geom_linestring = self.polygon2Linestring(buffer_geom)
-                if buffer_geom_linestring != None:
-                    features.append(buffer_geom_linestring)
-                features_unary_geom = QgsGeometry.unaryUnion(features)
-                features_unary_geom_parts = [QgsGeometry.fromWkt(i.asWkt()) for i in features_unary_geom.parts()]
-                features_polygonize = QgsGeometry.polygonize(features_unary_geom_parts)
-
-                for part in features_polygonize.parts():
-                    part_geom = QgsGeometry.fromWkt(part.asWkt())
-                    if part_geom.intersects(click_point_geom):
-                        if target_geom == None:
-                            target_geom = part_geom
-                        else:
-                            target_geom = target_geom.intersection(part_geom)
-                        break 
-
-        target_geom.convertGeometryCollectionToSubclass(2)
-
-        for part in target_geom.parts():
-            if part != None:
-                part_geom = QgsGeometry.fromWkt(part.asWkt())
-                if part_geom.intersects(click_point_geom):
-                    self.target_geom = part_geom
+        for poly_layer in polygon_layers:
+            if not poly_layer.isEditable():
+                poly_layer.startEditing()
 
         if self.target_geom != None:
             self.rubberBand.setToGeometry(self.target_geom,None)
@@ -320,6 +328,89 @@ class Painter:
                 else:
                     self.addFeature(t_layer)
 
+    def closeGapsDialog(self):
+        if self.gapsTask is not None:
+            self.gapsTask.cancel()
+        self.reset()
+
+    def fillGaps(self, indices, layer, open_form):
+        if not layer.isEditable():
+            layer.startEditing()
+
+        if open_form:
+            self.target_geom = self.gaps[indices[0]]
+            self.addFeature(layer)
+        else:
+            layer.beginEditCommand('Fill gaps')
+            features = []
+            for i in indices:
+                feature = QgsVectorLayerUtils.createFeature(layer)
+                feature.setGeometry(transformGeometry(self.gaps[i], self.canvasCrs(), layer.crs()))
+                features.append(feature)
+            layer.addFeatures(features)
+
+            for i in indices:
+                self.addTopologicalPoints(self.gaps[i])
+            layer.endEditCommand()
+            self.canvas.refresh()
+
+        self.filledGaps.update(indices)
+        self.rebuildGapsTable()
+
+    def findGaps(self):
+        polygon_layers, line_layers = self.restrictiveLayers()
+        if len(polygon_layers) == 0 and len(line_layers) == 0:
+            QMessageBox.warning(None,'Missing restrictive layers', 'Select one of the settings')
+            return
+
+        canvas_crs = self.canvasCrs()
+        if self.gapsDialog.comboBox_extent.currentIndex() == 0:
+            extent = self.canvas.extent()
+        else:
+            extent = QgsRectangle()
+            extent.setMinimal()
+            for layer in polygon_layers + line_layers:
+                extent.combineExtentWith(transformRect(layer.extent(), layer.crs(), canvas_crs))
+
+        # Open pieces are kept across the whole search, the tile count bounds them
+        tile_size = self.gapsDialog.doubleSpinBox_tileSize.value()
+        if tileCount(extent, tile_size) > MAX_TILES:
+            QMessageBox.warning(None,'Too many tiles', 'Increase the tile size or search the canvas extent only')
+            return
+
+        self.reset()
+        self.gaps = []
+        self.filledGaps = set()
+        self.rebuildGapsTable()
+        self.setGapsEnabled(False)
+        self.gapsDialog.pushButton_find.setText('Cancel')
+        self.gapsDialog.progressBar.setValue(0)
+
+        # Gaps are searched in the background, the table is only replaced when the task is done
+        self.gapsTask = GapTask(polygon_layers, line_layers, canvas_crs, tile_size, extent, indexCache())
+        self.gapsTask.gapsFound.connect(self.gapsFound)
+        self.gapsTask.gapsFailed.connect(self.gapsFailed)
+        self.gapsTask.progressChanged.connect(self.gapsProgressChanged)
+        self.gapsTask.taskCompleted.connect(self.gapsTaskDone)
+        self.gapsTask.taskTerminated.connect(self.gapsTaskDone)
+        QgsApplication.taskManager().addTask(self.gapsTask)
+
+    def gapsFailed(self, message):
+        self.iface.messageBar().pushWarning('Find gaps', message)
+
+    def gapsFound(self, gaps):
+        self.gaps = gaps
+        self.filledGaps = set()
+        self.rebuildGapsTable()
+
+    def gapsProgressChanged(self, progress):
+        self.gapsDialog.progressBar.setValue(int(progress))
+
+    def gapsTaskDone(self):
+        self.gapsTask = None
+        self.gapsDialog.pushButton_find.setText('Find')
+        self.setGapsEnabled(True)
+
     def getLayerListId(self, layerid, layer_type = 'All'):
         if layer_type == 'All':
             i = 0
@@ -447,16 +538,15 @@ class Painter:
             except TypeError:
                 pass
         
-    def polygon2Linestring(self, poly_geom):
-        p_geom = None
-        geom_parts = [p for p in poly_geom.parts()]
+    def lineNetwork(self, layers):
+        # Reused between clicks while the line layers, the canvas CRS and the search area stay the same
+        tile_size = self.settingsWidget.spinBox_searchArea.value() * TILE_FACTOR
+        if self.network is None or not self.network.isFor(layers, self.canvasCrs(), tile_size):
+            if self.network is not None:
+                self.network.release()
+            self.network = LineNetwork(layers, self.canvasCrs(), tile_size)
+        return self.network
 
-        for p in geom_parts:
-            p_geom = QgsGeometry.fromWkt(p.asWkt())
-            p_geom = QgsGeometry.fromPolyline([p for p in p_geom.vertices()])
-
-        return p_geom
-            
     def rebuildComboBox(self):
         self.settingsWidget.comboBox_targetLayer.clear()
         self.settingsWidget.comboBox_targetLayer.addItem(None)
@@ -464,6 +554,28 @@ class Painter:
             if l[0].geometryType() == 2:
                 self.settingsWidget.comboBox_targetLayer.addItem(l[0].name())
 
+    def rebuildGapsTable(self):
+        table = self.gapsDialog.tableWidget
+        table.setSortingEnabled(False)
+        table.setRowCount(0)
+
+        for i, gap in enumerate(self.gaps):
+            if i in self.filledGaps:
+                continue
+            row = table.rowCount()
+            table.insertRow(row)
+
+            item = QTableWidgetItem()
+            item.setData(Qt.DisplayRole, i + 1)
+            table.setItem(row, 0, item)
+
+            item = QTableWidgetItem()
+            item.setData(Qt.DisplayRole, round(gap.area(), 2))
+            table.setItem(row, 1, item)
+
+        table.setSortingEnabled(True)
+        self.gapsDialog.label_count.setText('Gaps: {}'.format(table.rowCount()))
+
     def rebuildListWidget(self):
         self.settingsWidget.listWidget.clear()
         if self.settingsWidget.checkBoxPolygon.isChecked():
@@ -496,6 +608,15 @@ class Painter:
     def reset(self):
         self.rubberBand.hide()
 
+    def restrictiveLayers(self):
+        polygon_layers = []
+        line_layers = []
+        if self.settingsWidget.checkBoxPolygon.isChecked():
+            polygon_layers = [l[0] for l in self.getLayers(2) or []]
+        if self.settingsWidget.checkBoxLine.isChecked():
+            line_layers = [l[0] for l in self.getLayers(1) or []]
+        return polygon_layers, line_layers
+
     def run(self):
         if self.toolButton.isChecked():
             self.iface.mapCanvas().setMapTool(self.tool)
@@ -504,6 +625,16 @@ class Painter:
             self.iface.mapCanvas().unsetMapTool(self.tool)
             self.settingsWidget.hide()
     
+    def selectedGaps(self):
+        table = self.gapsDialog.tableWidget
+        rows = set(index.row() for index in table.selectionModel().selectedRows())
+        return [table.item(row, 0).data(Qt.DisplayRole) - 1 for row in rows]
+
+    def setGapsEnabled(self, enabled):
+        self.gapsDialog.tableWidget.setEnabled(enabled)
+        self.gapsDialog.pushButton_fillSelected.setEnabled(enabled)
+        self.gapsDialog.pushButton_fillAll.setEnabled(enabled)
+
     def setLayers(self):
         self.layers = []
         for l in self.qgsProject.mapLayers():
@@ -512,10 +643,23 @@ class Painter:
                 if layer.geometryType() in [1,2]:
                     self.layers.append([layer,layer.id(),layer.geometryType()])
 
+    def showSelectedGaps(self):
+        self.rubberBand.reset(QgsWkbTypes.GeometryType(3))
+        for i in self.selectedGaps():
+            self.rubberBand.addGeometry(self.gaps[i], None)
+        self.rubberBand.show()
+
     def tr(self, message):
         return QCoreApplication.translate('Painter', message)
 
     def unload(self):
+        if self.gapsTask is not None:
+            self.gapsTask.cancel()
+
+        if self.network is not None:
+            self.network.release()
+            self.network = None
+
         for action in self.actions:
             self.iface.removePluginMenu(
                 self.tr(u'&Painter'),
@@ -549,24 +693,22 @@ class addPolygon(QgsMapTool):
         self.snap_mark.setIconType(QgsVertexMarker.ICON_BOX)
         self.snap_mark.setIconSize(10)
 
+        self.snapping = snappingService(self.canvas)
+        self.snapLayers = None
+
     def activate(self):
         self.action.setChecked(True)
         self.setCursor(Qt.CrossCursor)
+        self.snapping.reset()
+        if self.snapLayers is not None:
+            self.snapping.prepare(self.snapLayers())
 
     def canvasMoveEvent( self, e ):
-        self.snap_mark.hide()
-        self.snapPoint = False
-        self.snapPoint = self.checkSnapToPoint(e.pos())
-
-        if self.snapPoint[0]:
-            self.snap_mark.setCenter(self.snapPoint[1])
-            self.snap_mark.show()
-            point = self.snapPoint[1]
-        else:
-            point = self.toMapCoordinates(self.canvas.mouseLastXY())
+        self.showSnap(self.checkSnapToPoint(e.pos()))
 
     def canvasPressEvent (self, e):
         if e.button() == Qt.LeftButton:
+            self.snapPoint = self.checkSnapToPoint(e.pos(), True)
             if self.snapPoint[0]:
                 point = self.snapPoint[1]
             else:
@@ -575,18 +717,12 @@ class addPolygon(QgsMapTool):
             self.geometry_class.geometry = point
             self.pos.emit()
 
-    def checkSnapToPoint(self, point):
-        snapped = False
-        snap_point = self.toMapCoordinates(point)
-        snapper = self.canvas.snappingUtils()
-        snapMatch = snapper.snapToMap(point)
-        if snapMatch.hasVertex():
-            snap_point = snapMatch.point()
-            snapped = True
-        return snapped, snap_point
+    def checkSnapToPoint(self, point, force=False):
+        return self.snapping.snap(point, force, self.showSnap)
 
     def deactivate(self):
         self.action.setChecked(False)
+        self.snapping.reset()
         self.reset()
         self.deact.emit()
 
@@ -596,4 +732,11 @@ class addPolygon(QgsMapTool):
 
     def reset(self):
         self.snap_mark.hide()
-        self.res.emit()
\ No newline at end of file
+        self.res.emit()
+
+    def showSnap(self, snapPoint):
+        self.snapPoint = snapPoint
+        self.snap_mark.hide()
+        if self.snapPoint[0]:
+            self.snap_mark.setCenter(self.snapPoint[1])
+            self.snap_mark.show()
\ No newline at end of file
@@ -0,0 +1,33 @@
+# -*- coding: utf-8 -*-
+
+# ***************************************************************************
+#   This program is free software; you can redistribute it and/or modify    *
+#   it under the terms of the GNU General Public License as published by    *
+#   the Free Software Foundation; either version 2 of the License, or       *
+#   (at your option) any later version.                                     *
+# ***************************************************************************
+#     begin                : 2019-09-17                                     *
+#     copyright            : (C) 2019 by Adrian Bocianowski                 *
+#     email                : adrian at bocianowski.com.pl                   *
+# ***************************************************************************
+
+from qgis.core import QgsFeature, QgsSpatialIndex
+
+from .geometryParts import geometryRings
+
+class RingIndex:
+    def __init__(self, geometry):
+        # Exterior and interior rings of every part, built once per selected feature
+        self.rings = geometryRings(geometry)
+        self.index = QgsSpatialIndex(QgsSpatialIndex.FlagStoreFeatureGeometries)
+        for i, ring in enumerate(self.rings):
+            feature = QgsFeature(i)
+            feature.setGeometry(ring)
+            self.index.addFeature(feature)
+
+    def nearest(self, point):
+        # With stored geometries the neighbours are ordered by the real distance, not the bbox one
+        ids = self.index.nearestNeighbor(point, 1)
+        if len(ids) == 0:
+            return None
+        return self.rings[ids[0]]
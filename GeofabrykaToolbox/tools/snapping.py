@@ -0,0 +1,112 @@
+# -*- coding: utf-8 -*-
+
+# ***************************************************************************
+#   This program is free software; you can redistribute it and/or modify    *
+#   it under the terms of the GNU General Public License as published by    *
+#   the Free Software Foundation; either version 2 of the License, or       *
+#   (at your option) any later version.                                     *
+# ***************************************************************************
+#     begin                : 2019-09-17                                     *
+#     copyright            : (C) 2019 by Adrian Bocianowski                 *
+#     email                : adrian at bocianowski.com.pl                   *
+# ***************************************************************************
+
+from PyQt5.QtCore import QElapsedTimer, QPoint, QTimer
+
+from qgis.core import Qgis, QgsSnappingConfig, QgsSnappingUtils
+
+# One snap query per frame, in ms
+FRAME = 16
+# Layers above this size are indexed per extent by the hybrid strategy, they are not pre-built
+HYBRID_FEATURE_LIMIT = 50000
+
+_services = {}
+
+def snappingService(canvas):
+    # All tools working on the same canvas share one service
+    if id(canvas) not in _services:
+        _services[id(canvas)] = SnappingService(canvas)
+    return _services[id(canvas)]
+
+class SnappingService:
+    def __init__(self, canvas):
+        self.canvas = canvas
+        self.timer = QElapsedTimer()
+        self.lastPos = None
+        self.lastResult = None
+
+        # A throttled move gets one trailing query when the frame is over
+        self.trailingTimer = QTimer()
+        self.trailingTimer.setSingleShot(True)
+        self.trailingTimer.timeout.connect(self.trailingSnap)
+        self.trailingPos = None
+        self.trailingCallback = None
+
+    def prepare(self, layers):
+        # Build point locators in the background before the first mouse move needs them
+        if Qgis.QGIS_VERSION_INT < 31000:
+            return
+
+        utils = self.canvas.snappingUtils()
+        if not utils.config().enabled():
+            return
+
+        for layer in self.snappedLayers(layers):
+            if utils.indexingStrategy() == QgsSnappingUtils.IndexHybrid and layer.featureCount() > HYBRID_FEATURE_LIMIT:
+                continue
+            locator = utils.locatorForLayer(layer)
+            if not locator.hasIndex():
+                locator.init(-1, True)
+
+    def reset(self):
+        self.lastPos = None
+        self.lastResult = None
+        self.trailingTimer.stop()
+        self.trailingPos = None
+        self.trailingCallback = None
+
+    def snap(self, pos, force=False, trailing=None):
+        # trailing is called with the result of the query made once a throttled frame is over
+        if not force and self.lastResult is not None:
+            moved = abs(pos.x() - self.lastPos.x()) + abs(pos.y() - self.lastPos.y())
+            if moved < 1:
+                # Back at the last query, a pending trailing query would be for an old position
+                self.trailingTimer.stop()
+                return self.lastResult
+            if self.timer.elapsed() < FRAME:
+                # Throttled: the last result is kept until the trailing query, so markers do not flicker
+                if trailing is not None:
+                    self.trailingPos = QPoint(pos)
+                    self.trailingCallback = trailing
+                    self.trailingTimer.start(max(FRAME - self.timer.elapsed(), 0))
+                return self.lastResult
+
+        self.trailingTimer.stop()
+        snapped = False
+        snap_point = self.canvas.getCoordinateTransform().toMapCoordinates(pos)
+        snapMatch = self.canvas.snappingUtils().snapToMap(pos)
+        if snapMatch.hasVertex():
+            snap_point = snapMatch.point()
+            snapped = True
+
+        self.timer.start()
+        self.lastPos = QPoint(pos)
+        self.lastResult = (snapped, snap_point)
+        return self.lastResult
+
+    def snappedLayers(self, layers):
+        # Only the layers snapToMap queries under the project snapping configuration
+        utils = self.canvas.snappingUtils()
+        config = utils.config()
+        if config.mode() == QgsSnappingConfig.ActiveLayer:
+            return [l for l in layers if l == utils.currentLayer()]
+        if config.mode() == QgsSnappingConfig.AdvancedConfiguration:
+            return [l for l in layers if config.individualLayerSettings(l).enabled()]
+        canvas_layers = set(l.id() for l in self.canvas.layers())
+        return [l for l in layers if l.id() in canvas_layers]
+
+    def trailingSnap(self):
+        callback = self.trailingCallback
+        self.trailingCallback = None
+        if callback is not None:
+            callback(self.snap(self.trailingPos, True))
@@ -0,0 +1,74 @@
+# -*- coding: utf-8 -*-
+
+# ***************************************************************************
+#   This program is free software; you can redistribute it and/or modify    *
+#   it under the terms of the GNU General Public License as published by    *
+#   the Free Software Foundation; either version 2 of the License, or       *
+#   (at your option) any later version.                                     *
+# ***************************************************************************
+#     begin                : 2019-09-17                                     *
+#     copyright            : (C) 2019 by Adrian Bocianowski                 *
+#     email                : adrian at bocianowski.com.pl                   *
+# ***************************************************************************
+
+from qgis.core import Qgis, QgsGeometry, QgsPointXY, QgsRectangle, QgsVectorLayerEditUtils
+
+from .geometryParts import vertexPoints
+from .layerIndex import indexCache
+from .transforms import transformCache, transformGeometry
+
+# Search distance around a vertex, in layer units
+TOLERANCE = 1e-6
+
+def addTopologicalPoints(geometry, layers, crs=None, editing=None):
+    # crs is the geometry CRS, when given the geometry is reprojected to every layer CRS;
+    # editing is called with every layer before its points are added
+    prepared = {}
+
+    for layer in layers:
+        key = transformCache().crsKey(layer.crs()) if crs is not None else None
+        if key not in prepared:
+            layer_geom = QgsGeometry(geometry)
+            if crs is not None:
+                layer_geom = transformGeometry(layer_geom, crs, layer.crs())
+            bbox = layer_geom.boundingBox()
+            bbox.grow(TOLERANCE)
+            prepared[key] = (bbox, uniqueVertices(layer_geom))
+        bbox, points = prepared[key]
+
+        # Cheap rejection first: layer extent, then the layer index
+        if not layer.extent().intersects(bbox):
+            continue
+
+        index = indexCache().index(layer)
+        if len(index.intersects(bbox)) == 0:
+            continue
+
+        layer_points = [p for p in points if len(index.intersects(pointRectangle(p))) > 0]
+        if len(layer_points) == 0:
+            continue
+
+        if editing is not None:
+            editing(layer)
+        elif not layer.isEditable():
+            layer.startEditing()
+
+        topology = QgsVectorLayerEditUtils(layer)
+        if Qgis.QGIS_VERSION_INT >= 31600:
+            topology.addTopologicalPoints(layer_points)
+        else:
+            for point in layer_points:
+                topology.addTopologicalPoints(QgsPointXY(point))
+
+def pointRectangle(point):
+    return QgsRectangle(point.x() - TOLERANCE, point.y() - TOLERANCE, point.x() + TOLERANCE, point.y() + TOLERANCE)
+
+def uniqueVertices(geometry):
+    points = []
+    seen = set()
+    for point in vertexPoints(geometry):
+        key = (point.x(), point.y())
+        if key not in seen:
+            seen.add(key)
+            points.append(point)
+    return points
@@ -0,0 +1,68 @@
+# -*- coding: utf-8 -*-
+
+# ***************************************************************************
+#   This program is free software; you can redistribute it and/or modify    *
+#   it under the terms of the GNU General Public License as published by    *
+#   the Free Software Foundation; either version 2 of the License, or       *
+#   (at your option) any later version.                                     *
+# ***************************************************************************
+#     begin                : 2019-09-17                                     *
+#     copyright            : (C) 2019 by Adrian Bocianowski                 *
+#     email                : adrian at bocianowski.com.pl                   *
+# ***************************************************************************
+
+from qgis.core import QgsProject, QgsGeometry, QgsCoordinateTransform, QgsPointXY
+
+_transformCache = None
+
+def transformCache():
+    global _transformCache
+    if _transformCache is None:
+        _transformCache = TransformCache()
+    return _transformCache
+
+def transformGeometry(geometry, source_crs, destination_crs):
+    return transformCache().transformGeometry(geometry, source_crs, destination_crs)
+
+def transformPoint(point, source_crs, destination_crs):
+    return transformCache().transformPoint(point, source_crs, destination_crs)
+
+def transformRect(rect, source_crs, destination_crs):
+    return transformCache().transformRect(rect, source_crs, destination_crs)
+
+class TransformCache:
+    def __init__(self):
+        self.transforms = {}
+        QgsProject.instance().transformContextChanged.connect(self.clear)
+
+    def clear(self):
+        self.transforms = {}
+
+    def crsKey(self, crs):
+        # Custom CRS have no authid
+        return crs.authid() or crs.toWkt()
+
+    def isSame(self, source_crs, destination_crs):
+        return not source_crs.isValid() or not destination_crs.isValid() or source_crs == destination_crs
+
+    def transform(self, source_crs, destination_crs):
+        key = (self.crsKey(source_crs), self.crsKey(destination_crs))
+        if key not in self.transforms:
+            self.transforms[key] = QgsCoordinateTransform(source_crs, destination_crs, QgsProject.instance())
+        return self.transforms[key]
+
+    def transformGeometry(self, geometry, source_crs, destination_crs):
+        geometry = QgsGeometry(geometry)
+        if not self.isSame(source_crs, destination_crs):
+            geometry.transform(self.transform(source_crs, destination_crs))
+        return geometry
+
+    def transformPoint(self, point, source_crs, destination_crs):
+        if self.isSame(source_crs, destination_crs):
+            return QgsPointXY(point)
+        return self.transform(source_crs, destination_crs).transform(point)
+
+    def transformRect(self, rect, source_crs, destination_crs):
+        if self.isSame(source_crs, destination_crs):
+            return rect
+        return self.transform(source_crs, destination_crs).transformBoundingBox(rect)
@@ -0,0 +1,82 @@
+# -*- coding: utf-8 -*-
+
+# ***************************************************************************
+#   This program is free software; you can redistribute it and/or modify    *
+#   it under the terms of the GNU General Public License as published by    *
+#   the Free Software Foundation; either version 2 of the License, or       *
+#   (at your option) any later version.                                     *
+# ***************************************************************************
+
+# Micro-benchmark: WKT round-trip vs. geometry clone for splitting parts,
+# extracting rings and converting vertices on polygons with 10k+ vertices.
+#
+# Run with the QGIS Python interpreter from the repository root:
+#     python3 benchmarks/geometryParts_benchmark.py
+
+import gc
+import math
+import os
+import sys
+import timeit
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from qgis.core import QgsApplication, QgsGeometry, QgsPointXY
+
+from GeofabrykaToolbox.tools.geometryParts import geometryParts, geometryRings, vertexPoints
+
+def makeMultiPolygon(parts, vertices):
+    polygons = []
+    for p in range(parts):
+        cx = p * 1000.0
+        ring = [QgsPointXY(cx + 400 * math.cos(2 * math.pi * i / vertices), 400 * math.sin(2 * math.pi * i / vertices)) for i in range(vertices)]
+        hole = [QgsPointXY(cx + 100 * math.cos(2 * math.pi * i / 64), 100 * math.sin(2 * math.pi * i / 64)) for i in range(64)]
+        polygons.append([ring, hole])
+    return QgsGeometry.fromMultiPolygonXY(polygons)
+
+def wktParts(geometry):
+    return [QgsGeometry.fromWkt(p.asWkt()) for p in geometry.parts()]
+
+def wktRings(geometry):
+    return [QgsGeometry.fromPolyline([v for v in QgsGeometry.fromWkt(p.asWkt()).vertices()]) for p in geometry.parts()]
+
+def wktVertices(geometry):
+    return [QgsGeometry.fromWkt(v.asWkt()).asPoint() for v in geometry.vertices()]
+
+def residentKiB():
+    # Resident set size, so the QgsGeometry and WKT allocations made in C++ are counted too (Linux only)
+    with open('/proc/self/statm') as statm:
+        return int(statm.read().split()[1]) * os.sysconf('SC_PAGE_SIZE') / 1024.0
+
+def measure(label, func, geometry, number):
+    seconds = timeit.timeit(lambda: func(geometry), number=number) / number
+    gc.collect()
+    before = residentKiB()
+    # The result is kept alive while measuring, it is what the tools hold on to
+    result = func(geometry)
+    grown = residentKiB() - before
+    del result
+    print('{:<22}{:>12.2f} ms{:>14.1f} KiB'.format(label, seconds * 1000, grown))
+    return seconds
+
+def main():
+    app = QgsApplication([], False)
+    app.initQgis()
+
+    for parts, vertices in ((1, 10000), (4, 25000)):
+        geometry = makeMultiPolygon(parts, vertices)
+        print('\n{} part(s), {} vertices in total'.format(parts, sum(1 for _ in geometry.vertices())))
+        print('{:<22}{:>15}{:>18}'.format('', 'time', 'rss growth'))
+
+        for name, old, new, number in (
+                ('parts', wktParts, geometryParts, 20),
+                ('rings', wktRings, geometryRings, 20),
+                ('vertices', wktVertices, vertexPoints, 3)):
+            old_time = measure(name + ' (wkt)', old, geometry, number)
+            new_time = measure(name + ' (clone)', new, geometry, number)
+            print('{:<22}{:>14.1f}x'.format(name + ' speed-up', old_time / new_time))
+
+    app.exitQgis()
+
+if __name__ == '__main__':
+    main()